@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Response format benchmark.
+
+Compares encoding time, decoding time and payload size of a page of songs
+for every installed format, the way `BaseHandler.json_response` produces
+them and a client would read them.
+
+Usage:
+    python benchmarks/bench_formats.py
+"""
+
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from irdb.app.serializers import JSON_SERIALIZERS, MSGPACK_SERIALIZER  # noqa: E402
+
+SONGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dev_data_seeding', 'songs.json')
+PAGE_SIZE = 1000
+REPEAT = 20
+
+
+def load_page():
+    with open(SONGS_FILE, encoding='utf-8') as songs_file:
+        songs = json.load(songs_file)
+
+    return songs[:PAGE_SIZE]
+
+
+def bench_format(serializer, page):
+    body = serializer.dumps(page)
+    assert serializer.loads(body) == page
+
+    encode = min(timeit.repeat(lambda: serializer.dumps(page), number=1, repeat=REPEAT))
+    decode = min(timeit.repeat(lambda: serializer.loads(body), number=1, repeat=REPEAT))
+
+    return encode, decode, len(body)
+
+
+def main():
+    page = load_page()
+
+    serializers = [(f'json ({name})', serializer) for name, serializer in JSON_SERIALIZERS.items()]
+    if MSGPACK_SERIALIZER is not None:
+        serializers.append(('msgpack', MSGPACK_SERIALIZER))
+
+    print(f'Encoding and decoding a page of {len(page)} songs, best of {REPEAT}')
+    print(f"{'format':<18}{'encode ms':>11}{'decode ms':>11}{'bytes':>10}")
+
+    for name, serializer in serializers:
+        encode, decode, size = bench_format(serializer, page)
+        print(f'{name:<18}{encode * 1000:>11.2f}{decode * 1000:>11.2f}{size:>10}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""Serialization benchmark.
+
+Compares the per document cost of serializing a page of songs the way
+`BaseHandler._json_serialize` used to (an await per document, deleting
+'_id' and a second `json.dumps`) with the single pass of every installed
+JSON backend.
+
+Usage:
+    python benchmarks/bench_serialization.py
+"""
+
+
+import asyncio
+import copy
+import json
+import os
+import sys
+import timeit
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from irdb.app.serializers import JSON_SERIALIZERS  # noqa: E402
+
+SONGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dev_data_seeding', 'songs.json')
+PAGE_SIZE = 1000
+REPEAT = 20
+
+
+async def legacy_json_serialize(data):
+    if isinstance(data, list):
+        for i, chunk in enumerate(data):
+            data[i] = await legacy_json_serialize(chunk)
+
+    elif isinstance(data, dict):
+        if '_id' in data:
+            del data['_id']
+
+        return data
+
+    return json.dumps(data)
+
+
+def load_page():
+    with open(SONGS_FILE, encoding='utf-8') as songs_file:
+        songs = json.load(songs_file)
+
+    return songs[:PAGE_SIZE]
+
+
+def bench_legacy(page):
+    # The old path received documents including '_id' from the database
+    documents = [dict(song, _id=ObjectId()) for song in page]
+    loop = asyncio.new_event_loop()
+
+    def run():
+        loop.run_until_complete(legacy_json_serialize(copy.copy(documents)))
+
+    seconds = min(timeit.repeat(run, number=1, repeat=REPEAT))
+    loop.close()
+    return seconds
+
+
+def bench_backend(serializer, page):
+    # With the projection the documents arrive without '_id'
+    return min(timeit.repeat(lambda: serializer.dumps(page), number=1, repeat=REPEAT))
+
+
+def main():
+    page = load_page()
+
+    print(f'Serializing a page of {len(page)} songs, best of {REPEAT}')
+    print(f"{'path':<20}{'ms/page':>10}{'us/doc':>10}")
+
+    results = [('legacy', bench_legacy(page))]
+    results.extend((f'single pass {name}', bench_backend(serializer, page)) for name, serializer in JSON_SERIALIZERS.items())
+
+    for name, seconds in results:
+        print(f'{name:<20}{seconds * 1000:>10.2f}{seconds / len(page) * 1e6:>10.2f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Cold start benchmark.
+
+Measures how long a fresh interpreter takes to import the application and
+run `make_app()`, with the documentation stack loaded lazily (as it is now)
+and eagerly with the Swagger spec generated on every start (as it was). It
+also measures loading the spec on the first documentation request, from an
+up to date spec file and by regenerating it.
+
+Usage:
+    python benchmarks/bench_startup.py
+"""
+
+
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REPEAT = 10
+
+# Setup code of a scenario runs before the clock starts, interpreter startup
+# is the same for every scenario and left out as well.
+SETUP = f'import sys, time; sys.path.insert(0, {ROOT!r})\n'
+START = '\nstart = time.perf_counter()\n'
+REPORT = '\nprint(time.perf_counter() - start)\n'
+
+SCENARIOS = [
+    ('make_app, lazy docs', '', '''
+from irdb.irdb import make_app
+make_app()
+'''),
+    ('make_app, eager docs', '', '''
+import swagger_ui
+from irdb.init_swagger import generate_swagger_file
+from irdb.irdb import make_app, make_handlers
+make_app()
+generate_swagger_file(make_handlers(), 'swagger.json')
+'''),
+    ('first docs, cached spec', '''
+from irdb.init_swagger import load_swagger_file
+from irdb.irdb import make_handlers
+''', '''
+import swagger_ui
+load_swagger_file(make_handlers(), 'swagger.json')
+'''),
+    ('first docs, no spec', '''
+import os
+from irdb.init_swagger import load_swagger_file
+from irdb.irdb import make_handlers
+os.remove('swagger.json')
+''', '''
+import swagger_ui
+load_swagger_file(make_handlers(), 'swagger.json')
+'''),
+]
+
+
+def run(setup, code, cwd):
+    result = subprocess.run(
+        [sys.executable, '-c', SETUP + setup + START + code + REPORT], cwd=cwd, check=True, capture_output=True)
+    return float(result.stdout.decode().split()[-1])
+
+
+def main():
+    print(f'Cold start in a fresh interpreter, best of {REPEAT}')
+    print(f"{'scenario':<26}{'ms':>10}")
+
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, setup, code in SCENARIOS:
+            seconds = min(run(setup, code, cwd) for _ in range(REPEAT))
+            print(f'{name:<26}{seconds * 1000:>10.1f}')
+
+
+if __name__ == "__main__":
+    main()
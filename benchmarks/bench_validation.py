@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""Validation benchmark.
+
+Compares validations per second of song payloads with a new marshmallow
+schema per request (the way the handlers used to validate), a schema built
+once and the generated fast path of `Validator`, for single documents and
+for a bulk payload.
+
+Usage:
+    python benchmarks/bench_validation.py
+"""
+
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from irdb.app.schemas import VALIDATORS, SongSchema  # noqa: E402
+
+SONGS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dev_data_seeding', 'songs.json')
+BULK_SIZE = 1000
+REPEAT = 5
+
+
+def load_songs():
+    with open(SONGS_FILE, encoding='utf-8') as songs_file:
+        songs = json.load(songs_file)
+
+    # Unknown values are left out of a request body rather than sent as null
+    return [{key: value for key, value in song.items() if value is not None} for song in songs[:BULK_SIZE]]
+
+
+def per_second(function, count):
+    seconds = min(timeit.repeat(function, number=1, repeat=REPEAT))
+    return count / seconds
+
+
+def main():
+    songs = load_songs()
+    schema = SongSchema()
+    many_schema = SongSchema(many=True)
+    validator = VALIDATORS['songs']
+
+    single = [
+        ('schema per request', lambda: [SongSchema().validate(song) for song in songs]),
+        ('cached schema', lambda: [schema.validate(song) for song in songs]),
+        ('fast path', lambda: [validator.validate(song) for song in songs]),
+    ]
+    bulk = [
+        ('schema per request', lambda: SongSchema(many=True).validate(songs)),
+        ('cached schema', lambda: many_schema.validate(songs)),
+        ('fast path', lambda: validator.validate_many(songs)),
+    ]
+
+    print(f'Validating {len(songs)} songs, best of {REPEAT}')
+    print(f"{'payload':<8}{'validator':<20}{'songs/s':>12}")
+
+    for payload, runs in (('single', single), ('bulk', bulk)):
+        for name, function in runs:
+            print(f'{payload:<8}{name:<20}{per_second(function, len(songs)):>12.0f}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Admission control module.
+
+Module containing the concurrency limits put in front of the Request
+Handlers. Every handler class has a budget for reads and one for writes,
+requests over the limit wait in a bounded queue for a limited time and are
+rejected when the queue is full or the wait times out, so an overloaded
+server answers quickly instead of queueing work it cannot finish.
+"""
+
+
+import asyncio
+import math
+from collections import deque, namedtuple
+
+
+READ = 'read'
+WRITE = 'write'
+BUDGETS = (READ, WRITE)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Reasons for rejecting a request
+QUEUE_FULL = 'queue_full'
+TIMEOUT = 'timeout'
+REJECTIONS = (QUEUE_FULL, TIMEOUT)
+
+# A max_concurrency of 0 leaves the requests of a budget unlimited
+Budget = namedtuple('Budget', ['max_concurrency', 'max_queue', 'queue_timeout'])
+
+
+class Limiter:
+    """Concurrency limit with a bounded wait queue.
+
+    Waiting requests are admitted in arrival order, a finishing request
+    hands its slot directly to the first one waiting.
+    """
+
+    def __init__(self, max_concurrency, max_queue, queue_timeout, on_change=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._on_change = on_change
+
+        self.active = 0
+        self._waiters = deque()
+
+        self.admitted = 0
+        self.rejected = dict.fromkeys(REJECTIONS, 0)
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Wait for a slot.
+
+        Returns:
+            str: None when admitted, otherwise the reason of the rejection
+
+        """
+
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            self._changed()
+            return None
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected[QUEUE_FULL] += 1
+            return QUEUE_FULL
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._changed()
+
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+
+        except asyncio.TimeoutError:
+            # Unless the slot was handed over just as the wait timed out
+            if not future.done() or future.cancelled():
+                self._remove(future)
+                self.rejected[TIMEOUT] += 1
+                return TIMEOUT
+
+        except BaseException:
+            # Cancelled while waiting, a slot handed over in the meantime
+            # goes to the next one
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                self._remove(future)
+            raise
+
+        self.admitted += 1
+        return None
+
+    def release(self):
+        """Give the slot of a finished request to the next one waiting."""
+
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                self._changed()
+                return
+
+        self.active -= 1
+        self._changed()
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': dict(self.rejected),
+        }
+
+    def _remove(self, future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+        self._changed()
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change(self.active, len(self._waiters))
+
+
+class AdmissionController:
+    """Limiters per handler class and budget."""
+
+    def __init__(self, budgets, metrics=None):
+        """Set up the admission control.
+
+        Args:
+            budgets (dict): Budget per kind of request, READ or WRITE
+            metrics (obj): Metrics recording the queues and rejections
+
+        """
+
+        self.budgets = budgets
+        self.metrics = metrics
+        self._limiters = {}
+
+    async def admit(self, handler, method):
+        """Admit a request, waiting for a slot when needed.
+
+        Args:
+            handler (str): Name of the handler class
+            method (str): HTTP method
+
+        Returns:
+            tuple: Limiter to release when the request finishes, None when
+                the budget is unlimited or the request was rejected, and the
+                reason of a rejection
+
+        """
+
+        budget = READ if method in READ_METHODS else WRITE
+        if not self.budgets[budget].max_concurrency:
+            return None, None
+
+        limiter = self._limiters.get((handler, budget))
+        if limiter is None:
+            limiter = self._make_limiter(handler, budget)
+
+        reason = await limiter.acquire()
+        if reason is not None:
+            if self.metrics is not None:
+                self.metrics.admission_rejected(handler, budget, reason)
+
+            return None, reason
+
+        return limiter, None
+
+    def retry_after(self, method):
+        """Seconds a rejected client should wait before retrying."""
+
+        budget = self.budgets[READ if method in READ_METHODS else WRITE]
+
+        return max(1, math.ceil(budget.queue_timeout))
+
+    def stats(self):
+        return {f'{handler}.{budget}': limiter.stats() for (handler, budget), limiter in self._limiters.items()}
+
+    def _make_limiter(self, handler, budget):
+        on_change = None
+        if self.metrics is not None:
+            def on_change(active, queued):
+                self.metrics.admission_changed(handler, budget, active, queued)
+
+        settings = self.budgets[budget]
+        limiter = Limiter(settings.max_concurrency, settings.max_queue, settings.queue_timeout, on_change)
+        self._limiters[handler, budget] = limiter
+
+        return limiter
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Batching module.
+
+Module containing the write batcher that combines concurrent single inserts
+into bulk inserts.
+"""
+
+
+import asyncio
+import time
+
+
+# What made a queue get written, it was full or its first document waited
+# max_delay seconds
+FULL = 'full'
+DELAY = 'delay'
+FLUSH_TRIGGERS = (FULL, DELAY)
+
+
+class WriteBatcher:
+    """Combine inserts arriving close together into one bulk write.
+
+    Inserts are queued per collection. A queue is written once it holds
+    `max_batch_size` documents, or `max_delay` seconds after its first
+    document arrived, whichever comes first. Every caller gets the result
+    for its own document back.
+    """
+
+    def __init__(self, write, max_batch_size=100, max_delay=0.002, clock=time.monotonic, metrics=None):
+        """Initialize the batcher.
+
+        Args:
+            write (callable): Coroutine function taking a collection name
+                and a list of documents, returning a result per document
+            max_batch_size (int): Maximum number of documents per write
+            max_delay (float): Seconds a document waits for others at most
+            clock (callable): Clock used for the queue wait metrics
+            metrics (obj): Metrics recording the written batches
+
+        """
+
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._write = write
+        self._clock = clock
+        self._metrics = metrics
+
+        self._queues = {}
+        self._timers = {}
+        self._writes = set()
+
+        self.batches = 0
+        self.documents = 0
+        self.largest_batch = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def insert(self, collection, document):
+        """Queue a document and wait until its batch is written.
+
+        Args:
+            collection (str): Name of the collection
+            document (dict): Document to insert
+
+        Returns:
+            obj: Result of the write for this document
+
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        queue = self._queues.setdefault(collection, [])
+        queue.append((document, future, self._clock()))
+
+        if len(queue) >= self.max_batch_size:
+            self._flush(collection, FULL)
+
+        elif collection not in self._timers:
+            self._timers[collection] = loop.call_later(self.max_delay, self._flush, collection, DELAY)
+
+        # A caller giving up must not fail the batch for the others
+        return await asyncio.shield(future)
+
+    def stats(self):
+        """Counters of the batched writes.
+
+        Returns:
+            dict: Batches written, documents written, batch sizes, queue
+                waits in seconds and documents still queued
+
+        """
+
+        return {
+            'batches': self.batches,
+            'documents': self.documents,
+            'mean_batch_size': self.documents / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'queue_wait_total': self.queue_wait_total,
+            'queue_wait_max': self.queue_wait_max,
+            'mean_queue_wait': self.queue_wait_total / self.documents if self.documents else 0.0,
+            'queued': len(self),
+        }
+
+    def _flush(self, collection, trigger):
+        timer = self._timers.pop(collection, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._queues.pop(collection, None)
+        if batch:
+            # Keep a reference, the event loop only holds weak ones to tasks
+            write = asyncio.ensure_future(self._write_batch(collection, batch, trigger))
+            self._writes.add(write)
+            write.add_done_callback(self._writes.discard)
+
+    async def _write_batch(self, collection, batch, trigger):
+        now = self._clock()
+        waits = [now - queued_at for document, future, queued_at in batch]
+
+        self.batches += 1
+        self.documents += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        self.queue_wait_total += sum(waits)
+        self.queue_wait_max = max(self.queue_wait_max, *waits)
+
+        if self._metrics is not None:
+            self._metrics.write_batch_flushed(collection, trigger, len(batch), waits)
+
+        try:
+            results = await self._write(collection, [document for document, future, queued_at in batch])
+
+        except Exception as e:
+            if self._metrics is not None:
+                self._metrics.write_batch_failed(collection)
+
+            for document, future, queued_at in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    # Callers that gave up must not get it reported as
+                    # never retrieved
+                    future.exception()
+
+            return
+
+        for (document, future, queued_at), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Cache module.
+
+Module containing the in-process response cache placed in front of the
+database reads of the Request Handlers.
+"""
+
+
+import time
+from collections import OrderedDict, defaultdict, namedtuple
+
+
+CachedResponse = namedtuple('CachedResponse', ['body', 'etag', 'headers'])
+
+
+class ResponseCache:
+    """Bounded LRU cache of rendered responses with a time to live.
+
+    Every entry is stored under a set of tags, so writes can invalidate all
+    entries depending on a collection or a single document without knowing
+    their keys. Every invalidation of a tag bumps its generation, a response
+    read before a write is not stored after it.
+    """
+
+    def __init__(self, max_entries=1024, ttl=30.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+
+        self._entries = OrderedDict()
+        self._tags = defaultdict(set)
+        self._generations = defaultdict(int)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Get a cached response.
+
+        Args:
+            key (tuple): Cache key
+
+        Returns:
+            obj: CachedResponse, or None when not cached or expired
+
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires, tags, response = entry
+        if expires <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return response
+
+    def generation(self, tags):
+        """Current generation of tags, taken before reading a response."""
+
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def set(self, key, tags, response, generation=None):
+        """Cache a response, evicting the least recently used when full.
+
+        Args:
+            key (tuple): Cache key
+            tags (tuple): Tags to invalidate the entry by
+            response (obj): CachedResponse
+            generation (tuple): Generation of the tags before the response
+                was read, it is not stored when a tag was invalidated since
+
+        """
+
+        if generation is not None and generation != self.generation(tags):
+            self.stale += 1
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (self._clock() + self.ttl, tags, response)
+        for tag in tags:
+            self._tags[tag].add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, tag):
+        """Remove all entries stored under a tag."""
+
+        self._generations[tag] += 1
+
+        for key in list(self._tags.get(tag, ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def stats(self):
+        """Counters for sizing the cache.
+
+        Returns:
+            dict: Entries, hits, misses, evictions, expirations,
+                invalidations and responses not stored for being stale
+
+        """
+
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'stale': self.stale,
+        }
+
+    def _remove(self, key):
+        expires, tags, response = self._entries.pop(key)
+
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+def cache_key(request):
+    """Build the cache key of a request.
+
+    Query arguments are sorted so their order does not matter, the Accept
+    header is part of the key because it selects the representation.
+
+    Args:
+        request (obj): Tornado HTTPServerRequest
+
+    Returns:
+        tuple: Cache key
+
+    """
+
+    arguments = tuple(sorted((name, tuple(values)) for name, values in request.query_arguments.items()))
+
+    return request.path, arguments, request.headers.get('Accept', '')
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""Coalescing module.
+
+Module containing the single-flight layer that lets identical concurrent
+database reads share one query.
+"""
+
+
+import asyncio
+
+from bson import json_util
+
+
+class _Call:
+    # A call in flight, its deadline and the number of callers waiting for it
+
+    def __init__(self, task, deadline):
+        self.task = task
+        self.deadline = deadline
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Run at most one call per key at a time.
+
+    While the call for a key is in flight, other callers with the same key
+    wait for it and get the same result instead of starting their own call.
+    Results are shared between callers and must not be mutated.
+
+    A call runs under the deadline of the caller starting it, so a caller
+    only joins a call with a deadline at least as late as its own. Otherwise
+    it starts a new call that later callers join.
+
+    Calls belong to a group, like the collection they read. Invalidating a
+    group after a write makes later callers start a new call instead of
+    joining one that may have read the data before the write.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._generations = {}
+
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, function, deadline=None, group=None):
+        """Run `function` for a key, or join the call already in flight.
+
+        The call runs in its own task. A caller that is cancelled stops
+        waiting for it, the call itself is only cancelled when no caller is
+        left waiting.
+
+        Args:
+            key (str): Key identifying identical calls
+            function (callable): Coroutine function without arguments
+            deadline (float): IOLoop time the caller stops waiting, None
+                for no deadline
+            group (str): Group of the call, see `invalidate`
+
+        Returns:
+            obj: Result of the call
+
+        """
+
+        key = (group, self._generations.get(group, 0), key)
+        call = self._calls.get(key)
+
+        if call is not None and _covers(call.deadline, deadline):
+            self.coalesced += 1
+
+        else:
+            call = _Call(asyncio.ensure_future(function()), deadline)
+            self._calls[key] = call
+            self.calls += 1
+
+            def done(task):
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+
+                # Errors are raised to the callers, a call nobody waits for
+                # anymore must not be reported as never retrieved
+                if not task.cancelled():
+                    task.exception()
+
+            call.task.add_done_callback(done)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+
+        except asyncio.CancelledError:
+            if not call.task.done() and call.waiters == 1:
+                call.task.cancel()
+            raise
+
+        finally:
+            call.waiters -= 1
+
+    def invalidate(self, group):
+        """Keep later callers from joining the calls in flight of a group."""
+
+        self._generations[group] = self._generations.get(group, 0) + 1
+
+    def stats(self):
+        """Counters of the coalesced calls.
+
+        Returns:
+            dict: Calls made, calls coalesced into them and calls in flight
+
+        """
+
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls),
+        }
+
+
+def _covers(call_deadline, deadline):
+    # Whether a call runs at least until the deadline of a caller
+    if call_deadline is None:
+        return True
+
+    return deadline is not None and call_deadline >= deadline
+
+
+def query_key(*parts):
+    """Build a single-flight key from query parts.
+
+    Dictionaries are serialized with sorted keys, so filters built in a
+    different order still share a key.
+
+    Returns:
+        str: Key
+
+    """
+
+    return json_util.dumps(parts, sort_keys=True)
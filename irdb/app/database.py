@@ -0,0 +1,590 @@
+# -*- coding: utf-8 -*-
+"""Database helpers.
+
+Module containing the database side helpers used by the Request Handlers,
+like Id allocation and index management.
+"""
+
+
+import hashlib
+import json
+import re
+
+import pymongo
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.collation import Collation, CollationStrength
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from tornado.log import app_log
+
+from .schemas import ArtistCreateSchema, SongCreateSchema
+
+
+COUNTERS_COLLECTION = 'counters'
+
+# Mongo error code of a unique index violation
+DUPLICATE_KEY_ERROR = 11000
+
+HASH_FIELD = '_hash'
+VERSION_FIELD = '_version'
+
+# Schemas defining the content fields of each collection. The content hash
+# is computed over these fields only, so the Id and any internal fields never
+# influence duplicate detection.
+CONTENT_SCHEMAS = {
+    'artists': ArtistCreateSchema,
+    'songs': SongCreateSchema,
+}
+
+CONTENT_FIELDS = {
+    collection: sorted(schema().fields)
+    for collection, schema in CONTENT_SCHEMAS.items()
+}
+
+# Text filters compare case insensitive. Queries using this collation are
+# served by the indexes created with the same collation below.
+CASE_INSENSITIVE = Collation(locale='en', strength=CollationStrength.SECONDARY)
+
+# ICU sorts U+FFFF after every other character, which makes it the upper
+# bound of a prefix range.
+PREFIX_UPPER_BOUND = '\uffff'
+
+MATCH_MODES = ('contains', 'prefix', 'exact')
+
+DEFAULT_SORT = [('Id', pymongo.ASCENDING)]
+
+# Fields stored on the documents for internal bookkeeping only, these are
+# never sent to clients.
+INTERNAL_FIELDS = ('_id', HASH_FIELD, VERSION_FIELD)
+
+# Projection leaving the internal fields on the database server
+PUBLIC_PROJECTION = {field: 0 for field in INTERNAL_FIELDS}
+
+# Same as PUBLIC_PROJECTION, but keeping the version for ETags
+VERSIONED_PROJECTION = {'_id': 0, HASH_FIELD: 0}
+
+INDEXES = {
+    'artists': [
+        {'keys': [('Id', pymongo.ASCENDING)], 'name': 'Id_unique', 'unique': True},
+        {'keys': [(HASH_FIELD, pymongo.ASCENDING)], 'name': 'hash_unique', 'unique': True,
+         'partialFilterExpression': {HASH_FIELD: {'$exists': True}}},
+        {'keys': [('Name', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Name_ci',
+         'collation': CASE_INSENSITIVE},
+    ],
+    'songs': [
+        {'keys': [('Id', pymongo.ASCENDING)], 'name': 'Id_unique', 'unique': True},
+        {'keys': [(HASH_FIELD, pymongo.ASCENDING)], 'name': 'hash_unique', 'unique': True,
+         'partialFilterExpression': {HASH_FIELD: {'$exists': True}}},
+        {'keys': [('Name', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Name_ci',
+         'collation': CASE_INSENSITIVE},
+        {'keys': [('Genre', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Genre_ci',
+         'collation': CASE_INSENSITIVE},
+        # Range queries and sorting on the numeric fields, the Id makes the
+        # sort order unique for keyset pagination.
+        {'keys': [('Year', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Year_Id'},
+        {'keys': [('Bpm', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Bpm_Id'},
+        {'keys': [('Duration', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)], 'name': 'Duration_Id'},
+        # Genre equality combined with a range or sort on the numeric fields
+        {'keys': [('Genre', pymongo.ASCENDING), ('Year', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)],
+         'name': 'Genre_Year_ci', 'collation': CASE_INSENSITIVE},
+        {'keys': [('Genre', pymongo.ASCENDING), ('Bpm', pymongo.ASCENDING), ('Id', pymongo.ASCENDING)],
+         'name': 'Genre_Bpm_ci', 'collation': CASE_INSENSITIVE},
+    ],
+}
+
+
+def text_condition(value, mode='contains'):
+    """Build the query condition for a text filter.
+
+    The 'exact' and 'prefix' modes only use equality and range comparisons,
+    so with the CASE_INSENSITIVE collation they are answered from an index.
+    The 'contains' mode needs a regular expression and always scans, the
+    value is escaped so it can never be interpreted as a pattern.
+
+    Args:
+        value (str): Text to search for
+        mode (str): One of MATCH_MODES
+
+    Returns:
+        obj: Condition for the field in a query filter
+
+    """
+
+    if mode == 'exact':
+        return value
+
+    if mode == 'prefix':
+        return {'$gte': value, '$lt': value + PREFIX_UPPER_BOUND}
+
+    return {'$regex': re.escape(value), '$options': 'i'}
+
+
+def content_hash(collection, data):
+    """Compute the canonical content hash of a document.
+
+    The hash covers the schema fields of the collection in a fixed order,
+    missing fields are hashed as null.
+
+    Args:
+        collection (str): Name of the collection
+        data (dict): Document or request body
+
+    Returns:
+        str: Hex digest of the document content
+
+    """
+
+    values = [data.get(field) for field in CONTENT_FIELDS[collection]]
+    canonical = json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def version_condition(versions):
+    """Build the query condition matching any of the given versions.
+
+    Documents written before versioning existed have no version field, they
+    count as version 0.
+
+    Args:
+        versions (list): Accepted versions
+
+    Returns:
+        dict: Condition for the version field in a query filter
+
+    """
+
+    accepted = list(versions)
+    if 0 in accepted:
+        accepted.append(None)
+
+    return {'$in': accepted}
+
+
+def make_etag(version, representation=None):
+    """Make the ETag header value for a document version.
+
+    Args:
+        version (int): Version of the document
+        representation (str): Format and fields of a response body, None for
+            the document itself
+
+    Returns:
+        str: ETag, the version comes first so `parse_etags` finds it
+
+    """
+
+    if representation is None:
+        return f'"{version}"'
+
+    return f'"{version}-{representation}"'
+
+
+def parse_etags(header):
+    """Parse the versions out of an If-Match header.
+
+    Only the version part of an ETag is compared, any representation of a
+    version matches it.
+
+    Args:
+        header (str): Value of the If-Match header
+
+    Returns:
+        list: Versions the client accepts, None for '*' (any version)
+
+    """
+
+    if header.strip() == '*':
+        return None
+
+    versions = []
+    for etag in header.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+
+        try:
+            versions.append(int(etag.strip('"').split('-', 1)[0]))
+        except ValueError:
+            # Not one of our ETags, it can never match
+            continue
+
+    return versions
+
+
+def keyset_filter(query_filter, sort, after):
+    """Extend a query filter to only match documents after a keyset cursor.
+
+    Args:
+        query_filter (dict): Query filter, can be None
+        sort (list): Sort specification, either DEFAULT_SORT or a field
+            followed by 'Id' in the same direction
+        after (obj): Last seen Id for DEFAULT_SORT, a tuple of the last seen
+            sort value and Id otherwise
+
+    Returns:
+        dict: Query filter
+
+    """
+
+    field, direction = sort[0]
+    operator = '$gt' if direction == pymongo.ASCENDING else '$lt'
+
+    if len(sort) == 1:
+        condition = {'Id': {operator: after}}
+
+    else:
+        value, last_id = after
+
+        if value is None:
+            # Missing values sort before everything else
+            conditions = [{field: None, 'Id': {operator: last_id}}]
+            if direction == pymongo.ASCENDING:
+                conditions.append({field: {'$ne': None}})
+
+        else:
+            conditions = [{field: {operator: value}}, {field: value, 'Id': {operator: last_id}}]
+            if direction == pymongo.DESCENDING:
+                conditions.append({field: None})
+
+        condition = {'$or': conditions}
+
+    if query_filter:
+        return {'$and': [query_filter, condition]}
+
+    return condition
+
+
+def facet_pipeline(query_filter):
+    """Build the aggregation counting songs per genre and per decade.
+
+    Args:
+        query_filter (dict): Query filter of the songs to count
+
+    Returns:
+        list: Aggregation pipeline with a single '$facet' stage
+
+    """
+
+    return [
+        {'$match': query_filter or {}},
+        {'$facet': {
+            'total': [{'$count': 'count'}],
+            'genres': [
+                {'$group': {'_id': '$Genre', 'count': {'$sum': 1}}},
+                {'$sort': {'count': pymongo.DESCENDING, '_id': pymongo.ASCENDING}},
+            ],
+            'decades': [
+                {'$match': {'Year': {'$type': 'number'}}},
+                {'$group': {'_id': {'$subtract': ['$Year', {'$mod': ['$Year', 10]}]}, 'count': {'$sum': 1}}},
+                {'$sort': {'_id': pymongo.ASCENDING}},
+            ],
+        }},
+    ]
+
+
+async def ensure_indexes(db):
+    """Create all the indexes the handlers rely on.
+
+    Index creation is idempotent, so this is safe to run on every startup.
+
+    Args:
+        db (obj): Motor database instance
+
+    """
+
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            options = {key: value for key, value in index.items() if key != 'keys'}
+
+            try:
+                await db[collection].create_index(index['keys'], **options)
+
+            except OperationFailure as e:
+                # Most likely existing data violating a unique index, the
+                # application still works without it so do not block startup.
+                app_log.error("Could not create index %s on %s: %s", options['name'], collection, e)
+
+
+async def backfill_content_hashes(db, collection, batch_size=1000):
+    """Store the content hash on documents that do not have one yet.
+
+    Args:
+        db (obj): Motor database instance
+        collection (str): Name of the collection
+        batch_size (int): Number of updates sent per bulk write
+
+    Returns:
+        tuple: Number of updated documents and a list of Ids whose content
+            duplicates an other document
+
+    """
+
+    projection = {field: 1 for field in CONTENT_FIELDS[collection]}
+    projection['Id'] = 1
+
+    cursor = db[collection].find({HASH_FIELD: {'$exists': False}}, projection).batch_size(batch_size)
+
+    updated = 0
+    duplicates = []
+    while True:
+        documents = await cursor.to_list(batch_size)
+        if not documents:
+            break
+
+        requests = [
+            UpdateOne({'_id': document['_id']}, {'$set': {HASH_FIELD: content_hash(collection, document)}})
+            for document in documents
+        ]
+
+        try:
+            result = await db[collection].bulk_write(requests, ordered=False)
+            updated += result.modified_count
+
+        except BulkWriteError as e:
+            updated += e.details['nModified']
+            duplicates.extend(documents[error['index']]['Id'] for error in e.details['writeErrors'])
+
+    return updated, duplicates
+
+
+def is_id_conflict(error):
+    """Whether a duplicate key error was raised by the unique 'Id' index.
+
+    Args:
+        error (dict): Details of a DuplicateKeyError or of a bulk write error
+
+    Returns:
+        bool: True for the 'Id' index, False for the content hash
+
+    """
+
+    key_pattern = (error or {}).get('keyPattern')
+    if key_pattern is not None:
+        return 'Id' in key_pattern
+
+    # Servers before 4.2 only name the index in the message
+    return 'Id_unique' in (error or {}).get('errmsg', '')
+
+
+async def insert_documents(collection, id_allocator, items, max_time_ms=None):
+    """Insert many documents with one unordered insert.
+
+    Items duplicating an existing document or an earlier item are not
+    inserted, they get the Id of the original. All duplicates are found with
+    a single query on the content hashes and all Ids are allocated at once.
+
+    Args:
+        collection (obj): Motor collection
+        id_allocator (obj): IdAllocator handing out the new Ids
+        items (list): Validated documents, created ones get their 'Id' set
+        max_time_ms (int): Time limit of the duplicate lookups
+
+    Returns:
+        list: Tuples of HTTP status code and Id per item, 201 when created,
+            200 when duplicated and 500 when the insert failed
+
+    """
+
+    hashes = [content_hash(collection.name, item) for item in items]
+
+    existing = collection.find(
+        {HASH_FIELD: {'$in': list(set(hashes))}}, {HASH_FIELD: 1, 'Id': 1}, max_time_ms=max_time_ms,
+    )
+    known_ids = {document[HASH_FIELD]: document['Id'] async for document in existing}
+
+    # Only the first occurrence of new content is inserted
+    new_positions = {}
+    for position, document_hash in enumerate(hashes):
+        if document_hash not in known_ids and document_hash not in new_positions:
+            new_positions[document_hash] = position
+
+    results = [None] * len(items)
+    if new_positions:
+        new_ids = await id_allocator.next_ids(collection.name, len(new_positions))
+
+        documents = []
+        for new_id, (document_hash, position) in zip(new_ids, new_positions.items()):
+            items[position]['Id'] = new_id
+            documents.append(dict(items[position], **{HASH_FIELD: document_hash, VERSION_FIELD: 1}))
+            results[position] = (201, new_id)
+
+        try:
+            await collection.insert_many(documents, ordered=False)
+
+        except BulkWriteError as e:
+            failed = {error['index']: error for error in e.details['writeErrors']}
+            raced = []
+
+            if any(error['code'] == DUPLICATE_KEY_ERROR and is_id_conflict(error) for error in failed.values()):
+                # The counter fell behind, the items that failed on it are
+                # reported as failed and later inserts get free Ids again
+                await id_allocator.resync(collection.name)
+
+            for index, (document_hash, position) in enumerate(new_positions.items()):
+                error = failed.get(index)
+                if error is None:
+                    continue
+
+                del items[position]['Id']
+                if error['code'] == DUPLICATE_KEY_ERROR and not is_id_conflict(error):
+                    # Inserted concurrently by an other request
+                    raced.append(document_hash)
+                    results[position] = None
+
+                else:
+                    results[position] = (500, None)
+
+            if raced:
+                existing = collection.find(
+                    {HASH_FIELD: {'$in': raced}}, {HASH_FIELD: 1, 'Id': 1}, max_time_ms=max_time_ms,
+                )
+                known_ids.update({document[HASH_FIELD]: document['Id'] async for document in existing})
+
+    for position, document_hash in enumerate(hashes):
+        if results[position] is not None:
+            continue
+
+        if document_hash in known_ids:
+            results[position] = (200, known_ids[document_hash])
+
+        else:
+            # Duplicate of an earlier item, or lost a race with a document
+            # that is gone again
+            original = results[new_positions[document_hash]] or (500, None)
+            results[position] = (200, original[1]) if original[0] == 201 else original
+
+    return results
+
+
+class Collections:
+    """Motor collections with the options of each kind of operation.
+
+    Lets list queries read from other replica set members than single
+    document reads, and single and bulk writes use their own write concern.
+    Collections are created once per name and kind of operation.
+    """
+
+    def __init__(self, db, options=None):
+        """Initialize the collections.
+
+        Args:
+            db (obj): Motor database instance
+            options (dict): Kinds of operations mapped to `get_collection`
+                keyword arguments, see `config.collection_options`
+
+        """
+
+        self.db = db
+        self.options = options or {}
+        self._collections = {}
+
+    def get(self, name, operation=None):
+        """Get a collection for a kind of operation.
+
+        Args:
+            name (str): Name of the collection
+            operation (str): Kind of operation, like 'list' or 'bulk'
+
+        Returns:
+            obj: Motor collection
+
+        """
+
+        key = (name, operation)
+        collection = self._collections.get(key)
+
+        if collection is None:
+            collection = self.db.get_collection(name, **self.options.get(operation, {}))
+            self._collections[key] = collection
+
+        return collection
+
+
+class IdAllocator:
+    """Atomic Id allocator backed by a counters collection.
+
+    Every collection gets a counter document in the counters collection
+    holding the last handed out Id. Ids are allocated with a single
+    `find_one_and_update` using `$inc`, so concurrent inserts never receive
+    the same Id and the cost of an allocation does not grow with the size of
+    the collection.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._seeded = set()
+
+    async def next_id(self, collection):
+        """Allocate a single new Id for the given collection.
+
+        Args:
+            collection (str): Name of the collection
+
+        Returns:
+            int: Newly allocated Id
+
+        """
+
+        ids = await self.next_ids(collection, 1)
+        return ids[0]
+
+    async def next_ids(self, collection, count):
+        """Allocate a block of consecutive Ids for the given collection.
+
+        Args:
+            collection (str): Name of the collection
+            count (int): Number of Ids to allocate
+
+        Returns:
+            range: Newly allocated Ids
+
+        """
+
+        if collection not in self._seeded:
+            await self._seed_counter(collection)
+
+        counter = await self.db[COUNTERS_COLLECTION].find_one_and_update(
+            {'_id': collection},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+        last_id = counter['seq']
+        return range(last_id - count + 1, last_id + 1)
+
+    async def _seed_counter(self, collection):
+        # Documents that were inserted before the counter existed (seeded
+        # data) must never be handed out again. '$max' only ever raises the
+        # counter, so running this from several processes at once is safe.
+        cursor = self.db[collection].find({}, {'Id': 1}).sort('Id', pymongo.DESCENDING).limit(1)
+        documents = await cursor.to_list(1)
+        highest_id = documents[0]['Id'] if documents else 0
+
+        try:
+            await self.db[COUNTERS_COLLECTION].update_one(
+                {'_id': collection},
+                {'$max': {'seq': highest_id}},
+                upsert=True,
+            )
+
+        except DuplicateKeyError:
+            # Another process created the counter at the same moment, the
+            # retry simply applies '$max' to the existing document.
+            await self.db[COUNTERS_COLLECTION].update_one(
+                {'_id': collection},
+                {'$max': {'seq': highest_id}},
+            )
+
+        self._seeded.add(collection)
+
+    async def resync(self, collection):
+        """Raise the counter above the highest Id in the collection.
+
+        Needed when documents were inserted without taking an Id from the
+        counter, like by the seeder or a restore, and an allocated Id turned
+        out to be taken already.
+        """
+
+        self._seeded.discard(collection)
+        await self._seed_counter(collection)
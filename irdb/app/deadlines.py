@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Deadlines module.
+
+Module containing the helpers that bound the time spent on a request. The
+remaining time of a request is sent along with its database reads as
+`maxTimeMS`, and reads are tagged with a comment so they can be killed on
+the server when the request is abandoned.
+"""
+
+
+import asyncio
+import itertools
+import os
+
+from pymongo.errors import ExecutionTimeout
+from tornado.log import app_log
+
+
+# Header a client sets to change the deadline of its request, in seconds
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+# Exceptions telling the deadline of a request expired
+DEADLINE_ERRORS = (asyncio.TimeoutError, ExecutionTimeout)
+
+_operation_ids = itertools.count(1)
+
+# Running kill_operations tasks, the event loop only holds weak references
+_kill_tasks = set()
+
+
+class DeadlineExceeded(Exception):
+    """The deadline of a request expired before a database operation."""
+
+
+def request_timeout(header, default, maximum):
+    """Seconds a request may take.
+
+    Args:
+        header (str): Value of the TIMEOUT_HEADER, if any
+        default (float): Deadline of the route
+        maximum (float): Longest deadline a client can ask for
+
+    Returns:
+        float: Timeout in seconds
+
+    Raises:
+        ValueError: When the header is not a positive number
+
+    """
+
+    if header is None:
+        return default
+
+    try:
+        timeout = float(header)
+    except ValueError:
+        timeout = 0
+
+    if not timeout > 0:
+        raise ValueError(f"'{TIMEOUT_HEADER}' must be a positive number of seconds")
+
+    return min(timeout, maximum)
+
+
+def operation_comment():
+    """Unique comment to tag a database operation with.
+
+    Returns:
+        str: Comment, unique across the worker processes
+
+    """
+
+    return f'irdb-{os.getpid()}-{next(_operation_ids)}'
+
+
+async def killable(client, comment, awaitable):
+    """Await a database operation, killing it on the server when cancelled.
+
+    Args:
+        client (obj): MotorClient the operation runs on
+        comment (str): Comment the operation is tagged with
+        awaitable (obj): The operation
+
+    Returns:
+        obj: Result of the operation
+
+    """
+
+    try:
+        return await awaitable
+
+    except asyncio.CancelledError:
+        task = asyncio.ensure_future(kill_operations(client, comment))
+        _kill_tasks.add(task)
+        task.add_done_callback(_kill_tasks.discard)
+        raise
+
+
+async def kill_operations(client, comment):
+    """Kill the operations tagged with a comment on the server."""
+
+    try:
+        cursor = client.admin.aggregate([
+            {'$currentOp': {'localOps': True}},
+            {'$match': {'command.comment': comment}},
+            {'$project': {'opid': 1}},
+        ])
+        async for operation in cursor:
+            await client.admin.command('killOp', op=operation['opid'])
+
+    except Exception as e:
+        app_log.warning("Could not kill operation %s: %s", comment, e)
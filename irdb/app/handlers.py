@@ -5,20 +5,266 @@ Module containing all the used Request Handlers for the Tornado Server.
 """
 
 
-import json
-
-from tornado.web import RequestHandler
-from .schemas import ArtistSchema, SongSchema
+import asyncio
+import functools
+import hashlib
+import hmac
+from urllib.parse import urlencode
+
+import pymongo
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.log import app_log
+from tornado.web import HTTPError, RequestHandler
+from .cache import CachedResponse, cache_key
+from .coalesce import query_key
+from .config import READ_DETAIL, READ_LIST, WRITE_BULK, WRITE_SINGLE
+from .deadlines import (
+    DEADLINE_ERRORS, TIMEOUT_HEADER, DeadlineExceeded, killable, operation_comment, request_timeout,
+)
+from .database import (
+    CASE_INSENSITIVE, CONTENT_FIELDS, DEFAULT_SORT, HASH_FIELD, INTERNAL_FIELDS, MATCH_MODES,
+    PUBLIC_PROJECTION, VERSION_FIELD, VERSIONED_PROJECTION,
+    content_hash, facet_pipeline, insert_documents, is_id_conflict, keyset_filter, make_etag, parse_etags,
+    text_condition, version_condition,
+)
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .monitoring import RequestTiming, request_timing
+from .profiling import collapsed_stacks, pstats_dump
+from .schemas import VALIDATORS, ArtistSchema, SongSchema
+from .search import SEARCH_FIELDS
+from .serializers import JSON_CONTENT_TYPE, negotiate
+
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Querystring arguments of the numeric song fields, usable for ranges and sorting
+SONG_NUMERIC_ARGUMENTS = {'year': 'Year', 'bpm': 'Bpm', 'duration': 'Duration'}
+SONG_SORT_ARGUMENTS = dict(id='Id', **SONG_NUMERIC_ARGUMENTS)
+
+# Fields clients can select with the 'fields' querystring argument
+RESPONSE_FIELDS = {
+    'artists': tuple(ArtistSchema().fields),
+    'songs': tuple(SongSchema().fields),
+}
+
+# Attempts of a partial update racing with other writers before giving up
+UPDATE_RETRIES = 3
 
 
 class BaseHandler(RequestHandler):
 
-    async def json_response(self, data, status_code=200):
+    # Collection the GET responses of the handler are read from. Setting it
+    # puts the response cache in front of the handler.
+    cache_collection = None
+
+    # Whether requests wait for a slot of the admission control. Endpoints
+    # needed to diagnose an overload are always served.
+    admission_control = True
+
+    # Seconds the requests of the handler may take, None for the configured
+    # 'request_timeout'. Clients can change it with the 'X-Request-Timeout'
+    # header.
+    default_timeout = None
+
+    # Whether GET requests can be exported as NDJSON. An export streams a
+    # whole collection and gets the 'export_timeout' instead.
+    exports_ndjson = False
+
+    async def prepare(self):
+        self._cache_key = None
+        self._cache_headers = {}
+
+        metrics = self.settings['metrics']
+        if metrics is not None:
+            metrics.request_started(type(self).__name__, self.request.method)
+            self._metrics_started = True
+
+        # Collects the time of the database commands run for this request
+        self._db_timing = None
+        if self.settings['command_monitor'] is not None:
+            self._db_timing = RequestTiming()
+            request_timing.set(self._db_timing)
+
+        # Runs the handler method under the profiler when an admin asks for
+        # it with the 'X-Profile' header or the request is sampled
+        self._profile = None
+        profiler = self.settings['profiler']
+        if profiler is not None and (self._profile_requested() or profiler.sampled()):
+            self._profile = profiler.start()
+            name = self.request.method.lower()
+            setattr(self, name, profiler.wrap(getattr(self, name), self._profile))
+            self.set_header('X-Profile-Id', str(self._profile.id))
+
+        config = self.settings['config']
+        default_timeout = self.default_timeout or config.request_timeout
+        max_timeout = config.max_request_timeout
+        if self.exports_ndjson and self.request.method == 'GET' and self.accepts_ndjson():
+            default_timeout = max_timeout = config.export_timeout
+
+        try:
+            self._timeout = request_timeout(self.request.headers.get(TIMEOUT_HEADER), default_timeout, max_timeout)
+
+        except ValueError as e:
+            await self.json_response({"success": False, "errors": str(e)}, 400)
+            self.finish()
+            return
+
+        # The deadline includes the time waiting for admission
+        self._deadline = IOLoop.current().time() + self._timeout
+        self._task = None
+        name = self.request.method.lower()
+        setattr(self, name, self._with_deadline(getattr(self, name)))
+
+        cache = self.settings['response_cache']
+        if cache is None or self.cache_collection is None or self.request.method != 'GET':
+            await self._admit()
+            return
+
+        self._cache_key = cache_key(self.request)
+        # Writes finishing while the response is read make it stale
+        self._cache_generation = cache.generation(self.cache_tags())
+        response = cache.get(self._cache_key)
+
+        if response is not None:
+            self._write_cached_response(response)
+            self.finish()
+            return
+
+        await self._admit()
+
+    async def json_response(self, data, status_code=200, version=None):
+        """Write data in the format negotiated with the 'Accept' header.
+
+        GET responses are cached and get an ETag, a matching
+        'If-None-Match' is answered with a 304. The ETag of a document is
+        made of its version and the representation, the format and the
+        selected fields, so a 304 never confirms a body in an other
+        representation.
+        """
+
+        serializer = negotiate(self.request.headers.get('Accept'), self.settings['serializers'])
+
         self.set_status(status_code)
-        self.set_header("Content-Type", 'application/json')
+        self.set_header("Content-Type", serializer.content_type)
+        self.set_header("Vary", 'Accept')
+
+        body = serializer.dumps(data)
+
+        if status_code != 200 or self.request.method != 'GET':
+            self.write(body)
+            return
+
+        if version is not None:
+            representation = serializer.name
+            fields = self.get_argument('fields', None)
+            if fields is not None:
+                representation += '-' + hashlib.sha1(fields.encode()).hexdigest()[:8]
+
+            etag = make_etag(version, representation)
+
+        else:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+        headers = dict(self._cache_headers)
+        headers.update({"Content-Type": serializer.content_type, "Vary": 'Accept'})
+        response = CachedResponse(body, etag, headers)
+
+        if self._cache_key is not None:
+            self.settings['response_cache'].set(
+                self._cache_key, self.cache_tags(), response, generation=self._cache_generation,
+            )
+
+        self._write_cached_response(response)
+
+    def flush(self, include_footers=False):
+        timing = getattr(self, '_db_timing', None)
+        if timing is not None and not self._headers_written:
+            server_timing = timing.server_timing()
+            if server_timing is not None:
+                self.set_header('Server-Timing', server_timing)
+
+        # finish() flushes too, so this sees every byte of the body
+        self._response_size = getattr(self, '_response_size', 0) + sum(len(chunk) for chunk in self._write_buffer)
+
+        return super().flush(include_footers)
+
+    def on_finish(self):
+        limiter = getattr(self, '_limiter', None)
+        if limiter is not None:
+            limiter.release()
+            self._limiter = None
+
+        profile = getattr(self, '_profile', None)
+        if profile is not None:
+            self.settings['profiler'].add(
+                profile, type(self).__name__, self.request.method, self.request.uri, self.get_status(),
+                self.request.request_time(),
+            )
+
+        metrics = self.settings['metrics']
+        if metrics is None:
+            return
+
+        # Requests rejected before prepare() never counted as in flight
+        metrics.request_finished(
+            type(self).__name__, self.request.method, self.get_status(), self.request.request_time(),
+            getattr(self, '_response_size', 0), started=getattr(self, '_metrics_started', False),
+        )
+
+    def on_connection_close(self):
+        super().on_connection_close()
+
+        # Stop working for a client that is gone, whether the request waits
+        # for admission or runs. The database reads of the request are
+        # killed on the server when they are cancelled.
+        self._client_closed = True
+
+        task = getattr(self, '_task', None)
+        if task is not None and not task.done():
+            task.cancel()
 
-        data = await self._json_serialize(data)
-        self.write(data)
+    def max_time_ms(self):
+        """Milliseconds left until the deadline of the request.
+
+        Returns:
+            int: Value for the `maxTimeMS` of database operations
+
+        Raises:
+            DeadlineExceeded: When the deadline already expired
+
+        """
+
+        remaining = self._deadline - IOLoop.current().time()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+
+        return max(1, int(remaining * 1000))
+
+    def is_admin(self):
+        """Whether the request carries the admin token in 'X-Admin-Token'."""
+
+        token = self.settings['config'].admin_token
+        if not token:
+            return False
+
+        return hmac.compare_digest(self.request.headers.get('X-Admin-Token', '').encode(), token.encode())
+
+    def cache_tags(self):
+        """Tags of the cached responses, used to invalidate them on writes."""
+
+        if self.path_args:
+            return (f'{self.cache_collection}:{int(self.path_args[0])}',)
+
+        return (self.cache_collection,)
+
+    def set_cached_header(self, name, value):
+        """Set a header that is cached along with the response."""
+
+        self._cache_headers[name] = value
+        self.set_header(name, value)
 
     async def action_not_allowed(self):
         await self.json_response({'message': 'request is not allowed'}, 403)
@@ -26,86 +272,867 @@ class BaseHandler(RequestHandler):
     async def json_error(self):
         await self.json_response('404: Not Found', 404)
 
-    async def insert_into_db(self, collection, data):
-        db = self.settings['db']
+    async def json_conflict(self):
+        await self.json_response({"success": False, "errors": "Duplicate of an existing document"}, 409)
+
+    async def json_precondition_failed(self):
+        await self.json_response({"success": False, "errors": "Document has been modified, 'If-Match' does not match"}, 412)
+
+    async def write_status(self, status_code, version=None):
+        """Write the response for the status returned by a database write."""
+
+        if status_code == 404:
+            await self.json_error()
+
+        elif status_code == 409:
+            await self.json_conflict()
+
+        elif status_code == 412:
+            await self.json_precondition_failed()
+
+        else:
+            if version is not None:
+                self.set_header('ETag', make_etag(version))
+
+            await self.json_response('', status_code)
+
+    def id_errors(self, data, id):
+        """Validation errors of the 'Id' in the body of a single document.
+
+        The Id of a document never changes, a body may only repeat the Id of
+        the URL.
+
+        Returns:
+            dict: Validation errors, empty when valid
+
+        """
 
+        if data.get('Id', id) != id:
+            return {'Id': ['Must be the Id in the URL.']}
+
+        return {}
+
+    def get_collection(self, collection, operation):
+        """Get a collection with the options of a kind of operation.
+
+        Args:
+            collection (str): Name of the collection
+            operation (str): Kind of operation, like 'list' or 'single'
+
+        Returns:
+            obj: Motor collection
+
+        """
+
+        return self.settings['collections'].get(collection, operation)
+
+    def get_expected_versions(self):
+        """Versions accepted by the 'If-Match' header, None without one."""
+
+        header = self.request.headers.get('If-Match')
+        if header is None:
+            return None
+
+        return parse_etags(header)
+
+    async def insert_into_db(self, collection, data):
         try:
-            collection = db[collection]
+            collection = self.get_collection(collection, WRITE_SINGLE)
         except:
             return None
 
-        duplicate = await self._check_for_duplicate(collection, data)
+        write_batcher = self.settings['write_batcher']
+        if write_batcher is not None:
+            status, id = await write_batcher.insert(collection.name, data)
+            if status == 500:
+                raise HTTPError(500, 'Insert failed')
 
-        if duplicate is None:
-            id_list = await collection.distinct('Id')
+            if status == 201:
+                self._update_search_index(collection.name, document=data)
+                self._invalidate_cache(collection.name)
 
-            new_id = max(id_list) + 1
-            data['Id'] = new_id
+            return id
 
-            result = await collection.insert_one(data)
-            return data['Id']
+        document_hash = content_hash(collection.name, data)
+        duplicate = await self._check_for_duplicate(collection, document_hash)
 
-        else:
+        if duplicate is not None:
             return duplicate['Id']
 
-    async def find_in_db(self, collection, query_filter=None):
-        db = self.settings['db']
+        id_allocator = self.settings['id_allocator']
+
+        for attempt in range(UPDATE_RETRIES):
+            data['Id'] = await id_allocator.next_id(collection.name)
+
+            try:
+                await collection.insert_one(dict(data, **{HASH_FIELD: document_hash, VERSION_FIELD: 1}))
+
+            except DuplicateKeyError as e:
+                if not is_id_conflict(e.details):
+                    # A concurrent request inserted the same content between
+                    # the duplicate check and the insert, the unique index on
+                    # the hash rejected this one.
+                    duplicate = await self._check_for_duplicate(collection, document_hash)
+                    if duplicate is not None:
+                        return duplicate['Id']
+
+                # Documents were inserted without taking an Id from the
+                # counter, move it past them and take a new Id
+                await id_allocator.resync(collection.name)
+                continue
+
+            self._update_search_index(collection.name, document=data)
+            self._invalidate_cache(collection.name)
+            return data['Id']
+
+        raise HTTPError(500, 'Insert failed')
+
+    async def bulk_insert_into_db(self, collection, items):
+        """Insert many validated documents with one unordered insert.
+
+        Items duplicating an existing document or an earlier item in the
+        batch are not inserted, they get the Id of the original.
+
+        Args:
+            collection (str): Name of the collection
+            items (list): Validated documents, get their 'Id' set
+
+        Returns:
+            list: Tuples of HTTP status code and Id per item
+
+        """
+
+        id_allocator = self.settings['id_allocator']
+        results = await insert_documents(
+            self.get_collection(collection, WRITE_BULK), id_allocator, items, max_time_ms=self.max_time_ms(),
+        )
 
+        created = [item for item, (status, id) in zip(items, results) if status == 201]
+        for item in created:
+            self._update_search_index(collection, document=item)
+
+        if created:
+            self._invalidate_cache(collection)
+
+        return results
+
+    async def find_in_db(self, collection, query_filter=None, limit=None, after=None, collation=None, sort=None,
+                         projection=None):
         try:
-            collection = db[collection]
+            collection = self.get_collection(collection, READ_LIST)
         except:
             return None
 
-        if query_filter is None:
-            cursor = collection.find().sort('Id')
+        sort = sort or DEFAULT_SORT
+        projection = projection or PUBLIC_PROJECTION
 
-        else:
-            cursor = collection.find(query_filter).sort('Id')
+        if after is not None:
+            # Keyset pagination, the indexes on the sort fields let Mongo
+            # start right after the last seen document instead of skipping.
+            query_filter = keyset_filter(query_filter, sort, after)
 
-        documents = await cursor.to_list(100)
+        async def query():
+            # Documents are serialized as they come from the database, the
+            # projection keeps the internal fields out of them.
+            comment = operation_comment()
+            cursor = collection.find(
+                query_filter, projection, collation=collation, max_time_ms=self.max_time_ms(), comment=comment,
+            ).sort(sort)
+            cursor = cursor.batch_size(self.settings['cursor_batch_size'])
+
+            if limit is not None:
+                cursor = cursor.limit(limit)
+
+            return await killable(self.settings['db'].client, comment, cursor.to_list(limit))
+
+        # Identical concurrent queries share a single round trip, the
+        # documents are shared as well and must not be modified.
+        key = query_key('find', collection.name, query_filter, projection, sort, limit, collation and collation.document)
+        documents = await self._run_single_flight(collection.name, key, query)
 
         return documents
 
-    async def update_into_db(self, collection, id, data):
-        db = self.settings['db']
+    async def find_page_in_db(self, collection, query_filter=None, collation=None, sort=None, projection=None):
+        """Find a single page of documents.
+
+        Reads the 'limit' and 'after' querystring arguments and sets a 'Link'
+        header and 'X-Next-Cursor' header pointing to the next page when
+        there are more documents.
+
+        Returns:
+            list: Documents on the page, or None when the arguments are
+                invalid and an error response has been written
+
+        """
+
+        sort = sort or DEFAULT_SORT
 
         try:
-            collection = db[collection]
+            limit = int(self.get_argument('limit', self.settings['page_size']))
+            after = self.get_argument('after', None)
+            after = self._parse_cursor(after, sort) if after is not None else None
+
+        except ValueError:
+            await self.json_response({"success": False, "errors": "'limit' and 'after' must be valid numbers"}, 400)
+            return None
+
+        if limit < 1:
+            await self.json_response({"success": False, "errors": "'limit' must be at least 1"}, 400)
+            return None
+
+        limit = min(limit, self.settings['max_page_size'])
+
+        if projection is not None and projection.get('Id'):
+            # The cursor of the next page is made of the sort fields
+            projection = dict(projection, **{field: 1 for field, direction in sort})
+
+        # Fetch a single extra document to find out if there is a next page
+        documents = await self.find_in_db(
+            collection, query_filter, limit=limit + 1, after=after, collation=collation, sort=sort, projection=projection)
+
+        if len(documents) > limit:
+            documents = documents[:limit]
+            self._set_next_page_headers(self._make_cursor(documents[-1], sort), limit)
+
+        return documents
+
+    async def aggregate_in_db(self, collection, pipeline, collation=None):
+        try:
+            collection = self.get_collection(collection, READ_LIST)
         except:
             return None
 
-        # result = await collection.replace_one({'Id': id}, {'key': 'value'})
-        result = await collection.update_one({'Id': id}, {'$set': data})
+        comment = operation_comment()
+        cursor = collection.aggregate(pipeline, collation=collation, maxTimeMS=self.max_time_ms(), comment=comment)
+        documents = await killable(self.settings['db'].client, comment, cursor.to_list(None))
+
+        return documents
 
-        return result.modified_count
+    def accepts_ndjson(self):
+        return NDJSON_CONTENT_TYPE in self.request.headers.get('Accept', '')
 
-    async def delete_from_db(self, collection, id):
-        db = self.settings['db']
+    async def stream_ndjson(self, collection, query_filter=None, collation=None, sort=None, projection=None):
+        """Stream all matching documents as newline delimited JSON.
+
+        Documents are read from the cursor one batch at a time and every
+        batch is flushed to the client before the next one is fetched, so
+        memory use does not depend on the size of the collection.
+        """
 
         try:
-            collection = db[collection]
+            collection = self.get_collection(collection, READ_LIST)
         except:
             return None
 
-        result = await collection.delete_many({'Id': id})
-        return result
+        self.set_status(200)
+        self.set_header("Content-Type", NDJSON_CONTENT_TYPE)
 
-    async def _check_for_duplicate(self, collection, data):
-        document = await collection.find_one(data)
-        return document
+        batch_size = self.settings['cursor_batch_size']
+        dumps = self.settings['json_serializer'].dumps
+
+        # The time limit covers all batches of the cursor together, exports
+        # get the 'export_timeout' for that
+        comment = operation_comment()
+        cursor = collection.find(
+            query_filter, projection or PUBLIC_PROJECTION, collation=collation, max_time_ms=self.max_time_ms(),
+            comment=comment,
+        )
+        cursor = cursor.sort(sort or DEFAULT_SORT)
+        cursor = cursor.batch_size(batch_size)
+
+        try:
+            while True:
+                documents = await killable(self.settings['db'].client, comment, cursor.to_list(batch_size))
+                if not documents:
+                    break
+
+                self.write(b''.join(dumps(document) + b'\n' for document in documents))
+                await self.flush()
+
+        except StreamClosedError:
+            # Client went away, stop reading from the database
+            pass
+
+        finally:
+            # Also when the deadline expired, the cursor would stay open on
+            # the server until it times out otherwise
+            await cursor.close()
+
+    async def find_document_in_db(self, collection, id, projection=None):
+        """Find a single document by 'Id'.
+
+        Returns:
+            tuple: The document and its version, the document is None when it
+                does not exist
+
+        """
+
+        try:
+            collection = self.get_collection(collection, READ_DETAIL)
+        except:
+            return None, None
+
+        if projection is not None and projection.get('Id'):
+            projection = dict(projection, **{VERSION_FIELD: 1})
+
+        else:
+            projection = VERSIONED_PROJECTION
+
+        async def query():
+            comment = operation_comment()
+            return await killable(self.settings['db'].client, comment, collection.find_one(
+                {'Id': id}, projection, max_time_ms=self.max_time_ms(), comment=comment,
+            ))
+
+        key = query_key('find_one', collection.name, id, projection)
+        document = await self._run_single_flight(collection.name, key, query)
+        if document is None:
+            return None, None
+
+        document = dict(document)
+        return document, document.pop(VERSION_FIELD, 0)
+
+    async def update_into_db(self, collection, id, data, expected_versions=None):
+        """Update a document with a single conditional write.
+
+        A body with all content fields is applied with one
+        `find_one_and_update`. A partial body needs the current document to
+        compute the new content hash, it is written conditionally on the
+        version it was read at and retried when an other writer won.
+
+        Args:
+            collection (str): Name of the collection
+            id (int): Id of the document
+            data (dict): Validated new data
+            expected_versions (list): Versions from 'If-Match', if any
+
+        Returns:
+            tuple: HTTP status code and the new version of the document
+
+        """
+
+        try:
+            collection = self.get_collection(collection, WRITE_SINGLE)
+        except:
+            return 404, None
+
+        # The Id is only ever taken from the URL
+        data = {field: value for field, value in data.items() if field != 'Id'}
+
+        if all(field in data for field in CONTENT_FIELDS[collection.name]):
+            query = {'Id': id}
+            if expected_versions is not None:
+                query[VERSION_FIELD] = version_condition(expected_versions)
+
+            update = dict(data, **{HASH_FIELD: content_hash(collection.name, data)})
+            status_code, document = await self._conditional_update(collection, query, update)
+
+            if status_code == 404 and expected_versions is not None:
+                status_code = await self._missing_or_modified(collection, id)
+
+        else:
+            for attempt in range(UPDATE_RETRIES):
+                current = await collection.find_one({'Id': id}, VERSIONED_PROJECTION, max_time_ms=self.max_time_ms())
+                if current is None:
+                    return 404, None
+
+                version = current.pop(VERSION_FIELD, 0)
+                if expected_versions is not None and version not in expected_versions:
+                    return 412, None
+
+                query = {'Id': id, VERSION_FIELD: version_condition([version])}
+                update = dict(data, **{HASH_FIELD: content_hash(collection.name, {**current, **data})})
+                status_code, document = await self._conditional_update(collection, query, update)
+
+                if status_code != 404:
+                    break
+
+            else:
+                return 412, None
+
+        if status_code != 200:
+            return status_code, None
+
+        version = document.pop(VERSION_FIELD)
+        self._update_search_index(collection.name, document=document)
+        self._invalidate_cache(collection.name, id)
+
+        return 200, version
+
+    async def delete_from_db(self, collection, id, expected_versions=None):
+        """Delete a document with a single conditional write.
+
+        Returns:
+            int: HTTP status code
+
+        """
+
+        try:
+            collection = self.get_collection(collection, WRITE_SINGLE)
+        except:
+            return 404
+
+        query = {'Id': id}
+        if expected_versions is not None:
+            query[VERSION_FIELD] = version_condition(expected_versions)
+
+        # Unlike delete_one, findAndModify takes the time limit
+        deleted = await collection.find_one_and_delete(query, projection={'_id': 1}, maxTimeMS=self.max_time_ms())
+
+        if deleted is None:
+            if expected_versions is not None:
+                return await self._missing_or_modified(collection, id)
+
+            return 404
+
+        self._update_search_index(collection.name, doc_id=id)
+        self._invalidate_cache(collection.name, id)
+        return 200
+
+    async def get_text_filter(self, arguments):
+        """Build a case insensitive query filter from querystring arguments.
+
+        The 'match' querystring argument selects how values are compared,
+        see `text_condition`. The filter must be queried with the
+        CASE_INSENSITIVE collation.
+
+        Args:
+            arguments (dict): Querystring argument names mapped to fields
+
+        Returns:
+            dict: Query filter, or None when the arguments are invalid and an
+                error response has been written
+
+        """
+
+        match = self.get_argument('match', 'contains')
+
+        if match not in MATCH_MODES:
+            await self.json_response({"success": False, "errors": f"'match' must be one of {', '.join(MATCH_MODES)}"}, 400)
+            return None
+
+        query_filter = {}
+        for argument, field in arguments.items():
+            value = self.get_argument(argument, None)
+
+            if value is not None:
+                query_filter[field] = text_condition(value, match)
+
+        return query_filter
+
+    async def get_range_filter(self, arguments):
+        """Build a query filter from '_min' and '_max' querystring arguments.
+
+        Args:
+            arguments (dict): Querystring argument names mapped to fields,
+                'year' reads 'year_min' and 'year_max'
+
+        Returns:
+            dict: Query filter, or None when the arguments are invalid and an
+                error response has been written
+
+        """
+
+        query_filter = {}
+        for argument, field in arguments.items():
+            condition = {}
+
+            for suffix, operator in (('_min', '$gte'), ('_max', '$lte')):
+                value = self.get_argument(argument + suffix, None)
+                if value is None:
+                    continue
+
+                try:
+                    condition[operator] = int(value)
+
+                except ValueError:
+                    await self.json_response({"success": False, "errors": f"'{argument + suffix}' must be an integer"}, 400)
+                    return None
+
+            if condition:
+                query_filter[field] = condition
+
+        return query_filter
+
+    async def get_sort(self, arguments):
+        """Build a sort specification from the 'sort' querystring argument.
+
+        A leading '-' sorts descending, ties are broken on 'Id' so the order
+        is stable for keyset pagination.
+
+        Args:
+            arguments (dict): Querystring argument names mapped to fields
+
+        Returns:
+            list: Sort specification, or None when the argument is invalid and
+                an error response has been written
+
+        """
+
+        value = self.get_argument('sort', 'id')
+        direction = pymongo.DESCENDING if value.startswith('-') else pymongo.ASCENDING
+        field = arguments.get(value.lstrip('-'))
+
+        if field is None:
+            await self.json_response({"success": False, "errors": f"'sort' must be one of {', '.join(arguments)}"}, 400)
+            return None
+
+        if field == 'Id':
+            return [('Id', direction)]
+
+        return [(field, direction), ('Id', direction)]
+
+    async def get_song_filter(self):
+        """Build the query filter for songs from the querystring arguments.
+
+        Returns:
+            tuple: Query filter and the collation to query it with, or None
+                when the arguments are invalid and an error response has been
+                written
+
+        """
+
+        text_filter = await self.get_text_filter({'name': 'Name', 'genre': 'Genre'})
+        if text_filter is None:
+            return None
+
+        range_filter = await self.get_range_filter(SONG_NUMERIC_ARGUMENTS)
+        if range_filter is None:
+            return None
+
+        collation = CASE_INSENSITIVE if text_filter else None
+
+        return {**text_filter, **range_filter}, collation
+
+    async def get_projection(self, collection):
+        """Build a projection from the comma separated 'fields' argument.
+
+        The 'Id' is always selected, so documents stay identifiable.
+
+        Args:
+            collection (str): Name of the collection
+
+        Returns:
+            dict: Projection, or None when the argument is invalid and an
+                error response has been written
+
+        """
+
+        value = self.get_argument('fields', None)
+        if value is None:
+            return PUBLIC_PROJECTION
+
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        allowed = RESPONSE_FIELDS[collection]
+
+        if not fields or any(field not in allowed for field in fields):
+            errors = f"'fields' must be a comma separated list of {', '.join(allowed)}"
+            await self.json_response({"success": False, "errors": errors}, 400)
+            return None
+
+        projection = {'_id': 0, 'Id': 1}
+        projection.update({field: 1 for field in fields})
+
+        return projection
+
+    async def get_ids(self):
+        """Read the comma separated 'ids' querystring argument.
+
+        Returns:
+            list: Ids in request order, or None when the argument is invalid
+                and an error response has been written
+
+        """
+
+        value = self.get_argument('ids')
+
+        try:
+            ids = [int(id) for id in value.split(',') if id.strip()]
 
-    async def _json_serialize(self, data):
-        if isinstance(data, list):
-            for i, chunk in enumerate(data):
-                data[i] = await self._json_serialize(chunk)
+        except ValueError:
+            await self.json_response({"success": False, "errors": "'ids' must be a comma separated list of integers"}, 400)
+            return None
+
+        if len(ids) > self.settings['max_ids']:
+            errors = f"'ids' can hold at most {self.settings['max_ids']} Ids"
+            await self.json_response({"success": False, "errors": errors}, 400)
+            return None
+
+        return ids
+
+    async def find_many_in_db(self, collection, ids, projection=None):
+        """Find documents by a list of Ids with a single query.
+
+        Args:
+            collection (str): Name of the collection
+            ids (list): Ids to find
+            projection (dict): Projection of the documents
+
+        Returns:
+            list: Documents in the order of the Ids, None for missing Ids
+
+        """
+
+        documents = await self.find_in_db(collection, query_filter={'Id': {'$in': sorted(set(ids))}}, projection=projection)
+        if documents is None:
+            return None
+
+        by_id = {document['Id']: document for document in documents}
+
+        return [by_id.get(id) for id in ids]
+
+    def parse_body(self, validator, many=False):
+        """Parse the request body in the format of its 'Content-Type' and
+        validate it.
+
+        Bodies without a known format are parsed as JSON, NDJSON bodies are
+        parsed into a list.
+
+        Args:
+            validator (obj): Validator of the documents
+            many (bool): Accept a list of documents
+
+        Returns:
+            tuple: Parsed body and its validation errors
+
+        Raises:
+            ValueError: When the body is not valid
+
+        """
+
+        content_type = self.request.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        serializers = self.settings['serializers']
+
+        if content_type == NDJSON_CONTENT_TYPE:
+            serializer = self.settings['json_serializer']
+
+            def loads(body):
+                return [serializer.loads(line) for line in body.splitlines() if line.strip()]
+
+        else:
+            serializer = serializers.get(content_type, serializers[JSON_CONTENT_TYPE])
+            loads = serializer.loads
+
+        # Batches over the limit are rejected without validating them
+        max_items = self.settings['max_bulk_size'] if many else None
+
+        try:
+            return validator.parse(self.request.body, loads, many=many, max_items=max_items)
+
+        except ValueError as e:
+            if str(e):
+                raise
+
+            raise ValueError(f'Body is not valid {serializer.name}') from e
+
+    async def create_many(self, collection, items, validation_errors):
+        """Insert a batch of new documents.
+
+        Writes a 201 response when every item was created and a 207
+        response with the status per item otherwise. Batches over the
+        limit are answered with a 413, `parse_body` did not validate them.
+        """
+
+        if len(items) > self.settings['max_bulk_size']:
+            await self.json_response({
+                "success": False,
+                "errors": f"At most {self.settings['max_bulk_size']} items can be created at once"}, 413)
+            return
+
+        valid_positions = [position for position in range(len(items)) if position not in validation_errors]
+        valid_results = []
+        if valid_positions:
+            valid_results = await self.bulk_insert_into_db(collection, [items[position] for position in valid_positions])
+
+        results = [
+            {'index': position, 'status': 400, 'errors': errors}
+            for position, errors in validation_errors.items()
+        ]
+        for position, (status, id) in zip(valid_positions, valid_results):
+            result = {'index': position, 'status': status}
+            if id is not None:
+                result['Id'] = id
+
+            results.append(result)
+
+        results.sort(key=lambda result: result['index'])
+        created = all(result['status'] == 201 for result in results)
+        success = all(result['status'] in (200, 201) for result in results)
+
+        await self.json_response({"success": success, "results": results}, 201 if created else 207)
+
+    def _make_cursor(self, document, sort):
+        if len(sort) == 1:
+            return str(document['Id'])
+
+        value = document.get(sort[0][0])
+        return f"{'null' if value is None else value},{document['Id']}"
+
+    def _parse_cursor(self, cursor, sort):
+        if len(sort) == 1:
+            return int(cursor)
+
+        value, last_id = cursor.split(',')
+        return (None if value == 'null' else int(value)), int(last_id)
+
+    def _update_search_index(self, collection, document=None, doc_id=None):
+        index = self.settings['search_indexes'].get(collection)
+        if index is None:
+            return
+
+        if document is not None:
+            document = {key: value for key, value in document.items() if key not in INTERNAL_FIELDS}
+
+        index.apply_write(document, doc_id)
+
+    async def _admit(self):
+        # Cached responses are served before this, they are cheap enough to
+        # keep serving under overload
+        self._limiter = None
+
+        admission = self.settings['admission']
+        if admission is None or not self.admission_control:
+            return
+
+        self._task = asyncio.ensure_future(admission.admit(type(self).__name__, self.request.method))
+
+        try:
+            self._limiter, reason = await self._task
+
+        except asyncio.CancelledError:
+            if not getattr(self, '_client_closed', False):
+                raise
+
+            # The client went away while waiting, its slot went to the next
+            self.set_status(499, 'Client Closed Request')
+            self.finish()
+            return
+
+        self._task = None
+
+        if reason is not None:
+            self.set_header('Retry-After', str(admission.retry_after(self.request.method)))
+            await self.json_response({"success": False, "errors": "Server is overloaded, retry later"}, 503)
+            self.finish()
 
-        elif isinstance(data, dict):
-            if '_id' in data:
-                del data['_id']
+    def _with_deadline(self, method):
+        # Runs the handler method in its own task, so it can be cancelled when
+        # the deadline expires or the client disconnects
 
-            return data
+        @functools.wraps(method)
+        async def run(*args, **kwargs):
+            if getattr(self, '_client_closed', False):
+                # Gone before the request was admitted
+                self.set_status(499, 'Client Closed Request')
+                return
 
-        return json.dumps(data)
+            self._task = asyncio.ensure_future(method(*args, **kwargs))
+
+            try:
+                return await asyncio.wait_for(self._task, self._deadline - IOLoop.current().time())
+
+            except asyncio.CancelledError:
+                if not getattr(self, '_client_closed', False):
+                    raise
+
+                self.set_status(499, 'Client Closed Request')
+
+            except (DeadlineExceeded,) + DEADLINE_ERRORS:
+                await self._deadline_exceeded()
+
+        return run
+
+    async def _deadline_exceeded(self):
+        app_log.warning("%s %s exceeded its deadline of %g seconds", self.request.method, self.request.uri, self._timeout)
+
+        # A streamed response can only be cut off. Closing the connection
+        # keeps the final chunk from being written, so the client cannot
+        # take the truncated body for a complete one.
+        if self._headers_written:
+            self.request.connection.close()
+            return
+
+        self.clear()
+        await self.json_response(
+            {"success": False, "errors": f"Request did not finish within its deadline of {self._timeout:g} seconds"},
+            504,
+        )
+
+    def _profile_requested(self):
+        return self.request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes') and self.is_admin()
+
+    def _write_cached_response(self, response):
+        self.set_header('ETag', response.etag)
+
+        for name, value in response.headers.items():
+            self.set_header(name, value)
+
+        if self.check_etag_header():
+            self.set_status(304)
+
+        else:
+            self.write(response.body)
+
+    async def _run_single_flight(self, collection, key, function):
+        single_flight = self.settings['single_flight']
+        if single_flight is None:
+            return await function()
+
+        # The query runs with the time left of the request starting it
+        return await single_flight.run(key, function, deadline=self._deadline, group=collection)
+
+    def _invalidate_cache(self, collection, id=None):
+        # Reads in flight may have started before the write, later reads
+        # must not join them
+        single_flight = self.settings['single_flight']
+        if single_flight is not None:
+            single_flight.invalidate(collection)
+
+        cache = self.settings['response_cache']
+        if cache is None:
+            return
+
+        cache.invalidate(collection)
+        if id is not None:
+            cache.invalidate(f'{collection}:{id}')
+
+    def _set_next_page_headers(self, cursor, limit):
+        arguments = {key: values for key, values in self.request.query_arguments.items()}
+        arguments['after'] = [str(cursor)]
+        arguments['limit'] = [str(limit)]
+
+        next_url = f"{self.request.path}?{urlencode(arguments, doseq=True)}"
+
+        self.set_cached_header('Link', f'<{next_url}>; rel="next"')
+        self.set_cached_header('X-Next-Cursor', str(cursor))
+
+    async def _conditional_update(self, collection, query, update):
+        try:
+            document = await collection.find_one_and_update(
+                query,
+                {'$set': update, '$inc': {VERSION_FIELD: 1}},
+                projection=VERSIONED_PROJECTION,
+                return_document=ReturnDocument.AFTER,
+                maxTimeMS=self.max_time_ms(),
+            )
+
+        except DuplicateKeyError:
+            return 409, None
+
+        if document is None:
+            return 404, None
+
+        return 200, document
+
+    async def _missing_or_modified(self, collection, id):
+        # Only runs when a conditional write matched nothing, to tell the
+        # client whether the document is gone or was changed by someone else.
+        document = await collection.find_one({'Id': id}, {'_id': 1}, max_time_ms=self.max_time_ms())
+        return 404 if document is None else 412
+
+    async def _check_for_duplicate(self, collection, document_hash):
+        document = await collection.find_one({HASH_FIELD: document_hash}, {'Id': 1}, max_time_ms=self.max_time_ms())
+        return document
 
 
 class MainHandler(BaseHandler):
@@ -137,6 +1164,9 @@ class ArtistsHandler(BaseHandler):
     Endpoint for serving all artists.
     """
 
+    cache_collection = 'artists'
+    exports_ndjson = True
+
     async def get(self):
         """Return artists from our "database"
         ---
@@ -144,6 +1174,39 @@ class ArtistsHandler(BaseHandler):
         summary: Get Artists
         description: Get all the artists.
             Accepts URL querystring notation to search on artist 'name'.
+            Names are matched as substrings, 'match=prefix' and 'match=exact' are answered from an index.
+            Results are paginated, a 'Link' header points to the next page.
+            Request 'application/x-ndjson' in the Accept header to stream all results instead.
+            Pass 'ids' to get specific artists in one call instead, in the given order
+            with null for Ids that do not exist.
+        parameters:
+            - in: query
+              name: ids
+              description: Comma separated Ids of the artists to get
+              schema:
+                  type: string
+            - in: query
+              name: fields
+              description: Comma separated fields to return, 'Id' is always returned
+              schema:
+                  type: string
+            - in: query
+              name: match
+              description: How 'name' is compared, case insensitive
+              schema:
+                  type: string
+                  enum: [contains, prefix, exact]
+                  default: contains
+            - in: query
+              name: limit
+              description: Maximum number of artists on a page
+              schema:
+                  type: integer
+            - in: query
+              name: after
+              description: Cursor of the previous page, see the 'X-Next-Cursor' header
+              schema:
+                  type: integer
         responses:
             200:
                 description: List of artists
@@ -153,24 +1216,46 @@ class ArtistsHandler(BaseHandler):
                             type: array
                             items:
                                 ArtistSchema
+                    application/x-ndjson:
+                        schema:
+                            ArtistSchema
         """
 
-        name = self.get_argument('name', None)
+        projection = await self.get_projection('artists')
+        if projection is None:
+            return
+
+        if self.get_argument('ids', None) is not None:
+            ids = await self.get_ids()
+            if ids is not None:
+                await self.json_response(await self.find_many_in_db('artists', ids, projection=projection), 200)
+
+            return
 
-        filter = None
-        if name is not None:
-            filter = {'Name': {'$regex': rf"(?i){name}"}}
+        filter = await self.get_text_filter({'name': 'Name'})
+        if filter is None:
+            return
+
+        collation = CASE_INSENSITIVE if filter else None
+
+        if self.accepts_ndjson():
+            await self.stream_ndjson('artists', query_filter=filter, collation=collation, projection=projection)
+            return
 
-        artists = await self.find_in_db('artists', query_filter=filter)
+        artists = await self.find_page_in_db('artists', query_filter=filter, collation=collation, projection=projection)
 
-        await self.json_response(artists, 200)
+        if artists is not None:
+            await self.json_response(artists, 200)
 
     async def post(self):
         """Adds new artist into our "database"
         ---
         tags: [Artists]
         summary: Create a Artist
-        description: Create a Artist
+        description: Create a Artist.
+            Send an array, or NDJSON with the 'application/x-ndjson' Content-Type,
+            to create many at once. The response then holds the status per item.
+            Bodies can be sent as MessagePack with the 'application/msgpack' Content-Type.
         requestBody:
             description: New Artist data
             required: True
@@ -178,6 +1263,12 @@ class ArtistsHandler(BaseHandler):
                 application/json:
                     schema:
                         ArtistCreateSchema
+                application/msgpack:
+                    schema:
+                        ArtistCreateSchema
+                application/x-ndjson:
+                    schema:
+                        ArtistCreateSchema
         responses:
             201:
                 description: Success payload containing newly created Artist information
@@ -185,22 +1276,32 @@ class ArtistsHandler(BaseHandler):
                     application/json:
                         schema:
                             ArtistCreateSuccessSchema
+            207:
+                description: Status per item of a batch that was not created completely
+                content:
+                    application/json:
+                        schema:
+                            BulkCreateResultSchema
             400:
                 description: Bad request; Check `errors` for any validation errors
                 content:
                     application/json:
                         schema:
                             BadRequestSchema
+            413:
+                description: Too many items in a single batch
         """
 
         try:
-            new_artist = json.loads(self.request.body)
+            new_artist, validation_errors = self.parse_body(VALIDATORS['artists'], many=True)
 
-        except json.decoder.JSONDecodeError as e:
+        except ValueError as e:
             await self.json_response({"success": False, "errors": str(e)}, 400)
             return
 
-        validation_errors = ArtistSchema().validate(new_artist)
+        if isinstance(new_artist, list):
+            await self.create_many('artists', new_artist, validation_errors)
+            return
 
         if validation_errors:
             await self.json_response({"success": False, "errors": validation_errors}, 400)
@@ -218,12 +1319,20 @@ class ArtistHandler(BaseHandler):
     Implements CRUD for artists data. Aggregrates actions to the database if needed.
     """
 
+    cache_collection = 'artists'
+
     async def get(self, slug):
         """Return artist from our "database" based on 'Id'
         ---
         tags: [Artists]
         summary: Get specific Artist
         description: Get specific artist based on 'Id'.
+        parameters:
+            - in: query
+              name: fields
+              description: Comma separated fields to return, 'Id' is always returned
+              schema:
+                  type: string
         responses:
             200:
                 description: Dictionary of artist
@@ -234,11 +1343,14 @@ class ArtistHandler(BaseHandler):
                             items:
                                 ArtistSchema
         """
-        filter = {'Id': int(slug)}
-        artist = await self.find_in_db('artists', query_filter=filter)
+        projection = await self.get_projection('artists')
+        if projection is None:
+            return
+
+        artist, version = await self.find_document_in_db('artists', int(slug), projection=projection)
 
-        if len(artist) == 1:
-            await self.json_response(artist[0], 200)
+        if artist is not None:
+            await self.json_response(artist, 200, version=version)
 
         else:
             await self.json_error()
@@ -248,7 +1360,8 @@ class ArtistHandler(BaseHandler):
         ---
         tags: [Artists]
         summary: Update a Artist
-        description: Update a Artist
+        description: Update a Artist.
+            Send the ETag of the Artist in 'If-Match' to only update that version.
         requestBody:
             description: New Artist data
             required: True
@@ -256,6 +1369,9 @@ class ArtistHandler(BaseHandler):
                 application/json:
                     schema:
                         ArtistCreateSchema
+                application/msgpack:
+                    schema:
+                        ArtistCreateSchema
         responses:
             200:
                 description: Success payload
@@ -265,40 +1381,38 @@ class ArtistHandler(BaseHandler):
                     application/json:
                         schema:
                             BadRequestSchema
+            409:
+                description: Conflict; The new data duplicates an other Artist
+            412:
+                description: Precondition failed; The Artist changed since the ETag sent in 'If-Match'
         """
         
-        filter = {'Id': int(slug)}
-        artist = await self.find_in_db('artists', query_filter=filter)
-
-        if len(artist) == 0:
-            await self.json_error()
-            return
-
         try:
-            new_artist_data = json.loads(self.request.body)
-            artist = artist[0]
+            new_artist_data, validation_errors = self.parse_body(VALIDATORS['artists'])
 
-        except json.decoder.JSONDecodeError as e:
+        except ValueError as e:
             await self.json_response({"success": False, "errors": str(e)}, 400)
             return
 
-        validation_errors = ArtistSchema().validate(new_artist_data)
+        if not validation_errors:
+            validation_errors = self.id_errors(new_artist_data, int(slug))
 
         if validation_errors:
             await self.json_response({"success": False, "errors": validation_errors}, 400)
             return
 
         else:
-            result = await self.update_into_db('artists', artist['Id'], new_artist_data)
-            if result != 0:
-                await self.json_response('', 200)
+            status_code, version = await self.update_into_db(
+                'artists', int(slug), new_artist_data, expected_versions=self.get_expected_versions())
+            await self.write_status(status_code, version)
 
     async def delete(self, slug):
         """Delete Artist from our "database"
         ---
         tags: [Artists]
         summary: Delete a Artist
-        description: Delete a Artist
+        description: Delete a Artist.
+            Send the ETag of the Artist in 'If-Match' to only delete that version.
         responses:
             200:
                 description: Success payload
@@ -308,20 +1422,14 @@ class ArtistHandler(BaseHandler):
                     application/json:
                         schema:
                             BadRequestSchema
+            404:
+                description: Not found
+            412:
+                description: Precondition failed; The Artist changed since the ETag sent in 'If-Match'
         """
 
-        filter = {'Id': int(slug)}
-        artist = await self.find_in_db('artists', query_filter=filter)
-
-        if len(artist) == 0:
-            await self.json_error()
-            return
-
-        artist = artist[0]
-
-        result = await self.delete_from_db('artists', artist['Id'])
-
-        await self.json_response('', 200)
+        status_code = await self.delete_from_db('artists', int(slug), expected_versions=self.get_expected_versions())
+        await self.write_status(status_code)
 
 
 class SongsHandler(BaseHandler):
@@ -330,13 +1438,86 @@ class SongsHandler(BaseHandler):
     Endpoint for serving all Songs.
     """
 
+    cache_collection = 'songs'
+    exports_ndjson = True
+
     async def get(self):
         """Return Songs from our "database"
         ---
         tags: [Songs]
         summary: Get Songs
         description: Get all the Songs.
-            Accepts URL querystring notation to search on song 'name' and 'genre'
+            Accepts URL querystring notation to search on song 'name' and 'genre'.
+            Values are matched as substrings, 'match=prefix' and 'match=exact' are answered from an index.
+            Year, Bpm and Duration can be filtered on a range and sorted on.
+            Results are paginated, a 'Link' header points to the next page.
+            Request 'application/x-ndjson' in the Accept header to stream all results instead.
+            Pass 'ids' to get specific Songs in one call instead, in the given order
+            with null for Ids that do not exist.
+        parameters:
+            - in: query
+              name: ids
+              description: Comma separated Ids of the Songs to get
+              schema:
+                  type: string
+            - in: query
+              name: fields
+              description: Comma separated fields to return, 'Id' and the sort field are always returned
+              schema:
+                  type: string
+            - in: query
+              name: match
+              description: How 'name' and 'genre' are compared, case insensitive
+              schema:
+                  type: string
+                  enum: [contains, prefix, exact]
+                  default: contains
+            - in: query
+              name: year_min
+              description: Year minimum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: year_max
+              description: Year maximum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: bpm_min
+              description: Beats per Minute minimum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: bpm_max
+              description: Beats per Minute maximum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: duration_min
+              description: Duration in miliseconds minimum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: duration_max
+              description: Duration in miliseconds maximum of the Songs
+              schema:
+                  type: integer
+            - in: query
+              name: sort
+              description: Sort on 'id', 'year', 'bpm' or 'duration', prefix with '-' for descending
+              schema:
+                  type: string
+                  default: id
+            - in: query
+              name: limit
+              description: Maximum number of Songs on a page
+              schema:
+                  type: integer
+            - in: query
+              name: after
+              description: Cursor of the previous page, see the 'X-Next-Cursor' header
+              schema:
+                  type: string
         responses:
             200:
                 description: List of Songs
@@ -346,31 +1527,51 @@ class SongsHandler(BaseHandler):
                             type: array
                             items:
                                 SongsSchema
+                    application/x-ndjson:
+                        schema:
+                            SongsSchema
         """
 
-        name = self.get_argument('name', None)
-        genre = self.get_argument('genre', None)
+        projection = await self.get_projection('songs')
+        if projection is None:
+            return
 
-        filter = {}
-        if name is not None:
-            filter['Name'] = {'$regex': rf"(?i){name}"}
+        if self.get_argument('ids', None) is not None:
+            ids = await self.get_ids()
+            if ids is not None:
+                await self.json_response(await self.find_many_in_db('songs', ids, projection=projection), 200)
 
-        if genre is not None:
-            filter['Genre'] = {'$regex': rf"(?i){genre}"}
+            return
 
-        if len(filter) == 0:
-            filter = None
+        song_filter = await self.get_song_filter()
+        if song_filter is None:
+            return
 
-        songs = await self.find_in_db('songs', query_filter=filter)
+        filter, collation = song_filter
 
-        await self.json_response(songs, 200)
+        sort = await self.get_sort(SONG_SORT_ARGUMENTS)
+        if sort is None:
+            return
+
+        if self.accepts_ndjson():
+            await self.stream_ndjson('songs', query_filter=filter, collation=collation, sort=sort, projection=projection)
+            return
+
+        songs = await self.find_page_in_db(
+            'songs', query_filter=filter, collation=collation, sort=sort, projection=projection)
+
+        if songs is not None:
+            await self.json_response(songs, 200)
 
     async def post(self):
         """Adds new song into our "database"
         ---
         tags: [Songs]
         summary: Create a Song
-        description: Create a Song
+        description: Create a Song.
+            Send an array, or NDJSON with the 'application/x-ndjson' Content-Type,
+            to create many at once. The response then holds the status per item.
+            Bodies can be sent as MessagePack with the 'application/msgpack' Content-Type.
         requestBody:
             description: New Song data
             required: True
@@ -378,6 +1579,12 @@ class SongsHandler(BaseHandler):
                 application/json:
                     schema:
                         SongCreateSchema
+                application/msgpack:
+                    schema:
+                        SongCreateSchema
+                application/x-ndjson:
+                    schema:
+                        SongCreateSchema
         responses:
             201:
                 description: Success payload containing newly created Song information
@@ -385,22 +1592,32 @@ class SongsHandler(BaseHandler):
                     application/json:
                         schema:
                             SongCreateSuccessSchema
+            207:
+                description: Status per item of a batch that was not created completely
+                content:
+                    application/json:
+                        schema:
+                            BulkCreateResultSchema
             400:
                 description: Bad request; Check `errors` for any validation errors
                 content:
                     application/json:
                         schema:
                             BadRequestSchema
+            413:
+                description: Too many items in a single batch
         """
 
         try:
-            new_song = json.loads(self.request.body)
+            new_song, validation_errors = self.parse_body(VALIDATORS['songs'], many=True)
 
-        except json.decoder.JSONDecodeError as e:
+        except ValueError as e:
             await self.json_response({"success": False, "errors": str(e)}, 400)
             return
 
-        validation_errors = SongSchema().validate(new_song)
+        if isinstance(new_song, list):
+            await self.create_many('songs', new_song, validation_errors)
+            return
 
         if validation_errors:
             await self.json_response({"success": False, "errors": validation_errors}, 400)
@@ -412,18 +1629,71 @@ class SongsHandler(BaseHandler):
             await self.json_response(new_song, 201)
 
 
+class SongFacetsHandler(BaseHandler):
+    """Song Facets Handler for serving counts of Songs.
+
+    Endpoint for serving the number of Songs per genre and per decade.
+    """
+
+    cache_collection = 'songs'
+
+    # Counting scans all matching Songs, more than a page of them
+    default_timeout = 30.0
+
+    async def get(self):
+        """Return Song counts per genre and decade from our "database"
+        ---
+        tags: [Songs]
+        summary: Get Song facets
+        description: Count the Songs per genre and per decade.
+            Accepts the same filters as the Songs list.
+        responses:
+            200:
+                description: Total number of Songs with counts per genre and per decade
+            400:
+                description: Bad request; Check `errors` for any validation errors
+                content:
+                    application/json:
+                        schema:
+                            BadRequestSchema
+        """
+
+        song_filter = await self.get_song_filter()
+        if song_filter is None:
+            return
+
+        filter, collation = song_filter
+
+        result = await self.aggregate_in_db('songs', facet_pipeline(filter), collation=collation)
+        facets = result[0]
+
+        await self.json_response({
+            'total': facets['total'][0]['count'] if facets['total'] else 0,
+            'genres': [{'Genre': facet['_id'], 'count': facet['count']} for facet in facets['genres']],
+            'decades': [{'Decade': facet['_id'], 'count': facet['count']} for facet in facets['decades']],
+        }, 200)
+
+
 class SongHandler(BaseHandler):
     """Songs Handler for serving Songs data.
 
     Implements CRUD for artists data. Aggregrates actions to the database if needed.
     """
 
+    cache_collection = 'songs'
+
     async def get(self, slug):
         """Return song from our "database" based on 'Id'
         ---
         tags: [Songs]
         summary: Get specific Song
         description: Get specific Song based on 'Id'.
+        parameters:
+            - in: query
+              name: fields
+              description: Comma separated fields to return, 'Id' is always returned
+              schema:
+                  type: string
         responses:
             200:
                 description: Dictionary of Song
@@ -434,11 +1704,14 @@ class SongHandler(BaseHandler):
                             items:
                                 SongSchema
         """
-        filter = {'Id': int(slug)}
-        artist = await self.find_in_db('songs', query_filter=filter)
+        projection = await self.get_projection('songs')
+        if projection is None:
+            return
 
-        if len(artist) == 1:
-            await self.json_response(artist[0], 200)
+        song, version = await self.find_document_in_db('songs', int(slug), projection=projection)
+
+        if song is not None:
+            await self.json_response(song, 200, version=version)
 
         else:
             await self.json_error()
@@ -448,7 +1721,8 @@ class SongHandler(BaseHandler):
         ---
         tags: [Songs]
         summary: Update a Song
-        description: Update a Song
+        description: Update a Song.
+            Send the ETag of the Song in 'If-Match' to only update that version.
         requestBody:
             description: New Song data
             required: True
@@ -456,6 +1730,9 @@ class SongHandler(BaseHandler):
                 application/json:
                     schema:
                         SongCreateSchema
+                application/msgpack:
+                    schema:
+                        SongCreateSchema
         responses:
             200:
                 description: Success payload
@@ -465,39 +1742,37 @@ class SongHandler(BaseHandler):
                     application/json:
                         schema:
                             BadRequestSchema
+            409:
+                description: Conflict; The new data duplicates an other Song
+            412:
+                description: Precondition failed; The Song changed since the ETag sent in 'If-Match'
         """
-        filter = {'Id': int(slug)}
-        song = await self.find_in_db('songs', query_filter=filter)
-
-        if len(song) == 0:
-            await self.json_error()
-            return
-
         try:
-            new_song_data = json.loads(self.request.body)
-            song = song[0]
+            new_song_data, validation_errors = self.parse_body(VALIDATORS['songs'])
 
-        except json.decoder.JSONDecodeError as e:
+        except ValueError as e:
             await self.json_response({"success": False, "errors": str(e)}, 400)
             return
 
-        validation_errors = SongSchema().validate(new_song_data)
+        if not validation_errors:
+            validation_errors = self.id_errors(new_song_data, int(slug))
 
         if validation_errors:
             await self.json_response({"success": False, "errors": validation_errors}, 400)
             return
 
         else:
-            result = await self.update_into_db('songs', song['Id'], new_song_data)
-            if result != 0:
-                await self.json_response('', 200)
+            status_code, version = await self.update_into_db(
+                'songs', int(slug), new_song_data, expected_versions=self.get_expected_versions())
+            await self.write_status(status_code, version)
 
     async def delete(self, slug):
         """Delete Song from our "database"
         ---
         tags: [Songs]
         summary: Delete a Song
-        description: Delete a Song
+        description: Delete a Song.
+            Send the ETag of the Song in 'If-Match' to only delete that version.
         responses:
             200:
                 description: Success payload
@@ -507,19 +1782,206 @@ class SongHandler(BaseHandler):
                     application/json:
                         schema:
                             BadRequestSchema
+            404:
+                description: Not found
+            412:
+                description: Precondition failed; The Song changed since the ETag sent in 'If-Match'
         """
-        filter = {'Id': int(slug)}
-        song = await self.find_in_db('songs', query_filter=filter)
+        status_code = await self.delete_from_db('songs', int(slug), expected_versions=self.get_expected_versions())
+        await self.write_status(status_code)
 
-        if len(song) == 0:
-            await self.json_error()
+
+class SearchHandler(BaseHandler):
+    """Search Handler for ranked search on Artists and Songs.
+
+    Searches are answered from the in-process search index, which is kept
+    up to date by the other handlers.
+    """
+
+    async def get(self):
+        """Search artists and songs
+        ---
+        tags: [Search]
+        summary: Search Artists and Songs
+        description: Ranked search on the names of artists and the name, artist,
+            album and genre of songs. Tolerates typos, set 'prefix' for autocomplete.
+        parameters:
+            - in: query
+              name: q
+              description: Search query
+              required: True
+              schema:
+                  type: string
+            - in: query
+              name: type
+              description: Only search 'artists' or 'songs'
+              schema:
+                  type: string
+                  enum: [artists, songs]
+            - in: query
+              name: prefix
+              description: Treat the last word of the query as a prefix
+              schema:
+                  type: boolean
+            - in: query
+              name: limit
+              description: Maximum number of hits
+              schema:
+                  type: integer
+        responses:
+            200:
+                description: List of hits, best match first
+            400:
+                description: Bad request; Check `errors` for any validation errors
+                content:
+                    application/json:
+                        schema:
+                            BadRequestSchema
+        """
+
+        query = self.get_argument('q', '')
+        resource = self.get_argument('type', None)
+        prefix = self.get_argument('prefix', 'false').lower() in ('1', 'true', 'yes')
+
+        try:
+            limit = min(int(self.get_argument('limit', 10)), self.settings['max_page_size'])
+
+        except ValueError:
+            await self.json_response({"success": False, "errors": "'limit' must be an integer"}, 400)
+            return
+
+        if limit < 1:
+            await self.json_response({"success": False, "errors": "'limit' must be at least 1"}, 400)
+            return
+
+        if resource is not None and resource not in SEARCH_FIELDS:
+            await self.json_response({"success": False, "errors": f"'type' must be one of {', '.join(SEARCH_FIELDS)}"}, 400)
+            return
+
+        indexes = self.settings['search_indexes']
+        resources = [resource] if resource is not None else list(indexes)
+
+        hits = []
+        for name in resources:
+            index = indexes[name]
+            await index.ensure_loaded(self.get_collection(name, READ_LIST))
+
+            for score, document in index.search(query, limit=limit, prefix=prefix):
+                hits.append({'type': name, 'score': score, 'document': document})
+
+        hits.sort(key=lambda hit: -hit['score'])
+
+        await self.json_response(hits[:limit], 200)
+
+
+class StatsHandler(BaseHandler):
+    """Stats Handler for serving internal counters.
+
+    Endpoint for serving the counters of the response cache, the coalescing
+    of database reads, the batching of inserts, the slow database commands
+    and the admission control.
+    """
+
+    admission_control = False
+
+    # Served from memory, a slow answer means the worker is stuck
+    default_timeout = 5.0
+
+    async def get(self):
+        cache = self.settings['response_cache']
+        single_flight = self.settings['single_flight']
+        write_batcher = self.settings['write_batcher']
+        command_monitor = self.settings['command_monitor']
+        admission = self.settings['admission']
+
+        await self.json_response({
+            'response_cache': cache.stats() if cache is not None else None,
+            'single_flight': single_flight.stats() if single_flight is not None else None,
+            'write_batcher': write_batcher.stats() if write_batcher is not None else None,
+            'slow_queries': command_monitor.stats() if command_monitor is not None else None,
+            'admission': admission.stats() if admission is not None else None,
+        }, 200)
+
+
+class MetricsHandler(BaseHandler):
+    """Metrics Handler for serving the request metrics.
+
+    Endpoint for serving the request counts, latencies, response sizes and
+    event loop lag of all worker processes in the Prometheus text format.
+    """
+
+    admission_control = False
+
+    # Served from memory, a slow answer means the worker is stuck
+    default_timeout = 5.0
+
+    async def get(self):
+        metrics = self.settings['metrics']
+        if metrics is None:
+            raise HTTPError(404)
+
+        self.set_header("Content-Type", METRICS_CONTENT_TYPE)
+        self.write(metrics.render())
+
+
+class AdminHandler(BaseHandler):
+    """Base of the admin endpoints, only answered with the admin token."""
+
+    admission_control = False
+    default_timeout = 5.0
+
+    async def prepare(self):
+        await super().prepare()
+
+        if self._finished:
             return
 
-        song = song[0]
+        if not self.is_admin():
+            await self.json_response({"success": False, "errors": "A valid 'X-Admin-Token' header is required"}, 403)
+            self.finish()
 
-        result = await self.delete_from_db('songs', song['Id'])
 
-        await self.json_response('', 200)
+class ProfilesHandler(AdminHandler):
+    """Profiles Handler for listing the stored request profiles.
 
+    Endpoint for listing the profiles of sampled requests and of requests
+    sent with the 'X-Profile' header, the newest first.
+    """
+
+    async def get(self):
+        profiler = self.settings['profiler']
+        if profiler is None:
+            await self.json_response({"success": False, "errors": "Profiling is disabled"}, 404)
+            return
+
+        await self.json_response(profiler.summaries(), 200)
+
+
+class ProfileHandler(AdminHandler):
+    """Profile Handler for downloading a single request profile.
 
+    Endpoint for downloading a profile with 'format=pstats', loadable with
+    `pstats.Stats`, or with 'format=collapsed' as collapsed stacks for
+    flamegraph tools.
+    """
+
+    async def get(self, id):
+        profiler = self.settings['profiler']
+        record = profiler.get(int(id)) if profiler is not None else None
+        if record is None:
+            await self.json_response({"success": False, "errors": "Profile not found"}, 404)
+            return
+
+        profile_format = self.get_query_argument('format', 'pstats')
 
+        if profile_format == 'pstats':
+            self.set_header("Content-Type", 'application/octet-stream')
+            self.set_header("Content-Disposition", f'attachment; filename="profile-{record.id}.pstats"')
+            self.write(pstats_dump(record))
+
+        elif profile_format == 'collapsed':
+            self.set_header("Content-Type", 'text/plain; charset=utf-8')
+            self.write(collapsed_stacks(record))
+
+        else:
+            await self.json_response({"success": False, "errors": "'format' must be 'pstats' or 'collapsed'"}, 400)
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""Metrics module.
+
+Module containing the request metrics exported in the Prometheus text
+format. All series are allocated up front in a flat array of doubles, so
+recording a request is a few index lookups and additions. With a metrics
+directory every worker process keeps its array in a memory mapped file and
+the exposition adds up the files of all workers.
+"""
+
+
+import bisect
+import glob
+import mmap
+import os
+import threading
+
+from tornado.ioloop import IOLoop
+
+from .admission import BUDGETS, REJECTIONS
+from .batching import FLUSH_TRIGGERS
+
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+METHODS = ('GET', 'HEAD', 'POST', 'DELETE', 'PATCH', 'PUT', 'OPTIONS')
+COMMANDS = (
+    'find', 'getMore', 'aggregate', 'distinct', 'count', 'insert', 'update', 'delete', 'findAndModify', 'other',
+)
+
+LOOP_LAG_INTERVAL = 0.5
+
+FILE_PATTERN = 'metrics-*.db'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metrics:
+    """Request metrics of the handlers of one application.
+
+    Only the worker process owning an array writes to it, so requests need no
+    locks. MongoDB commands are recorded from the worker threads of Motor and
+    take a lock guarding the command series only. Counters and histograms of
+    workers that exited are kept in the totals, their gauges are left out.
+    """
+
+    def __init__(self, handlers, directory=None, collections=()):
+        """Allocate all series.
+
+        Args:
+            handlers (list): Names of the instrumented handlers
+            directory (str): Directory shared by the worker processes, None
+                keeps the metrics in this process only
+            collections (tuple): Collections with their own MongoDB command
+                series, the others are counted as 'other'
+
+        """
+
+        self.directory = directory
+        self._families = []
+        self._size = 0
+        self._gauges = []
+
+        self._requests = self._family('irdb_requests_total', 'counter', 'Requests handled')
+        self._durations = self._family('irdb_request_duration_seconds', 'histogram', 'Request latency')
+        self._sizes = self._family('irdb_response_size_bytes', 'histogram', 'Response body size')
+        self._in_flight = self._family('irdb_requests_in_flight', 'gauge', 'Requests being handled')
+        self._loop_lag = self._family('irdb_event_loop_lag_seconds', 'histogram', 'Event loop scheduling delay')
+        self._commands = self._family('irdb_mongo_command_duration_seconds', 'histogram', 'MongoDB command latency')
+        self._command_failures = self._family('irdb_mongo_command_failures_total', 'counter', 'MongoDB commands failed')
+        self._admission_active = self._family('irdb_admission_active', 'gauge', 'Requests admitted and running')
+        self._admission_queued = self._family('irdb_admission_queue_depth', 'gauge', 'Requests waiting for admission')
+        self._admission_rejections = self._family(
+            'irdb_admission_rejections_total', 'counter', 'Requests rejected by the admission control',
+        )
+        self._write_batches = self._family('irdb_write_batches_total', 'counter', 'Batches of inserts written')
+        self._write_batch_failures = self._family(
+            'irdb_write_batch_failures_total', 'counter', 'Batches of inserts failed',
+        )
+        self._write_batch_sizes = self._family('irdb_write_batch_size', 'histogram', 'Inserts per written batch')
+        self._write_batch_waits = self._family(
+            'irdb_write_batch_queue_wait_seconds', 'histogram', 'Time inserts waited for their batch',
+        )
+
+        # Slots of every handler and method, looked up once per request
+        self._slots = {}
+        for handler in handlers:
+            in_flight = self._series(self._in_flight, {'handler': handler}, gauge=True)
+
+            for method in METHODS:
+                labels = {'handler': handler, 'method': method}
+                statuses = [
+                    self._series(self._requests, dict(labels, status=status)) for status in STATUS_CLASSES
+                ]
+                durations = self._histogram(self._durations, labels, DURATION_BUCKETS)
+                sizes = self._histogram(self._sizes, labels, SIZE_BUCKETS)
+
+                self._slots[handler, method] = (statuses, durations, sizes, in_flight)
+
+        self._admission_slots = {}
+        for handler in handlers:
+            for budget in BUDGETS:
+                labels = {'handler': handler, 'budget': budget}
+                self._admission_slots[handler, budget] = (
+                    self._series(self._admission_active, labels, gauge=True),
+                    self._series(self._admission_queued, labels, gauge=True),
+                    {
+                        reason: self._series(self._admission_rejections, dict(labels, reason=reason))
+                        for reason in REJECTIONS
+                    },
+                )
+
+        self._loop_lag_slots = self._histogram(self._loop_lag, {}, LOOP_LAG_BUCKETS)
+
+        self._command_slots = {}
+        for collection in tuple(collections) + ('other',):
+            for command in COMMANDS:
+                labels = {'collection': collection, 'command': command}
+                self._command_slots[collection, command] = (
+                    self._histogram(self._commands, labels, DURATION_BUCKETS),
+                    self._series(self._command_failures, labels),
+                )
+
+        self._write_batch_slots = {}
+        for collection in tuple(collections) + ('other',):
+            labels = {'collection': collection}
+            self._write_batch_slots[collection] = (
+                {
+                    trigger: self._series(self._write_batches, dict(labels, trigger=trigger))
+                    for trigger in FLUSH_TRIGGERS
+                },
+                self._series(self._write_batch_failures, labels),
+                self._histogram(self._write_batch_sizes, labels, BATCH_SIZE_BUCKETS),
+                self._histogram(self._write_batch_waits, labels, DURATION_BUCKETS),
+            )
+
+        self._command_lock = threading.Lock()
+
+        self.values = self._allocate()
+
+    def request_started(self, handler, method):
+        """Count a request as in flight."""
+
+        slots = self._slots.get((handler, method))
+        if slots is not None:
+            self.values[slots[3]] += 1
+
+    def request_finished(self, handler, method, status, duration, size, started=True):
+        """Record a finished request.
+
+        Args:
+            handler (str): Name of the handler
+            method (str): HTTP method
+            status (int): HTTP status code
+            duration (float): Seconds since the request arrived
+            size (int): Bytes in the response body
+            started (bool): Whether `request_started` was called for it
+
+        """
+
+        slots = self._slots.get((handler, method))
+        if slots is None:
+            return
+
+        statuses, durations, sizes, in_flight = slots
+        values = self.values
+
+        values[statuses[min(max(status // 100, 1), 5) - 1]] += 1
+        self._observe(durations, DURATION_BUCKETS, duration)
+        self._observe(sizes, SIZE_BUCKETS, size)
+
+        if started:
+            values[in_flight] -= 1
+
+    def admission_changed(self, handler, budget, active, queued):
+        """Record the requests running and waiting under a budget."""
+
+        slots = self._admission_slots.get((handler, budget))
+        if slots is not None:
+            self.values[slots[0]] = active
+            self.values[slots[1]] = queued
+
+    def admission_rejected(self, handler, budget, reason):
+        slots = self._admission_slots.get((handler, budget))
+        if slots is not None:
+            self.values[slots[2][reason]] += 1
+
+    def write_batch_flushed(self, collection, trigger, size, waits):
+        """Record a batch of inserts being written.
+
+        Args:
+            collection (str): Collection of the batch
+            trigger (str): What made the batch get written, one of
+                FLUSH_TRIGGERS
+            size (int): Inserts in the batch
+            waits (list): Seconds every insert waited for the batch
+
+        """
+
+        slots = self._write_batch_slots.get(collection) or self._write_batch_slots['other']
+        batches, failures, sizes, queue_waits = slots
+
+        self.values[batches[trigger]] += 1
+        self._observe(sizes, BATCH_SIZE_BUCKETS, size)
+        for wait in waits:
+            self._observe(queue_waits, DURATION_BUCKETS, wait)
+
+    def write_batch_failed(self, collection):
+        slots = self._write_batch_slots.get(collection) or self._write_batch_slots['other']
+        self.values[slots[1]] += 1
+
+    def command_finished(self, command, collection, duration, failed=False):
+        """Record a finished MongoDB command.
+
+        Args:
+            command (str): Name of the command
+            collection (str): Collection it ran on
+            duration (float): Seconds the command took
+            failed (bool): Whether the command failed
+
+        """
+
+        command = command if command in COMMANDS else 'other'
+        durations, failures = self._command_slots.get((collection, command)) or self._command_slots['other', command]
+
+        with self._command_lock:
+            self._observe(durations, DURATION_BUCKETS, duration)
+            if failed:
+                self.values[failures] += 1
+
+    def start_loop_monitor(self, interval=LOOP_LAG_INTERVAL):
+        """Measure the event loop lag on the current IOLoop.
+
+        A callback is scheduled every interval, the delay between the
+        moment it was due and the moment it ran is how long other work
+        blocked the loop.
+        """
+
+        io_loop = IOLoop.current()
+
+        def check(due):
+            self._observe(self._loop_lag_slots, LOOP_LAG_BUCKETS, max(io_loop.time() - due, 0.0))
+            schedule()
+
+        def schedule():
+            due = io_loop.time() + interval
+            io_loop.call_at(due, check, due)
+
+        schedule()
+
+    def render(self):
+        """Render all series in the Prometheus text format.
+
+        Returns:
+            str: Exposition of the metrics of all workers
+
+        """
+
+        values = self._collect()
+        lines = []
+
+        for name, kind, help_text, series in self._families:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+            for labels, slot in series:
+                if kind == 'histogram':
+                    buckets, bucket_slots, sum_slot, count_slot = slot
+                    cumulative = 0.0
+                    for bound, bucket_slot in zip(buckets + ('+Inf',), bucket_slots):
+                        cumulative += values[bucket_slot]
+                        lines.append(f'{name}_bucket{_labels(dict(labels, le=_number(bound)))} {_number(cumulative)}')
+
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(values[sum_slot])}')
+                    lines.append(f'{name}_count{_labels(labels)} {_number(values[count_slot])}')
+
+                else:
+                    lines.append(f'{name}{_labels(labels)} {_number(values[slot])}')
+
+        return '\n'.join(lines) + '\n'
+
+    def _family(self, name, kind, help_text):
+        family = (name, kind, help_text, [])
+        self._families.append(family)
+        return family[3]
+
+    def _slot(self):
+        self._size += 1
+        return self._size - 1
+
+    def _series(self, family, labels, gauge=False):
+        slot = self._slot()
+        family.append((labels, slot))
+        if gauge:
+            self._gauges.append(slot)
+
+        return slot
+
+    def _histogram(self, family, labels, buckets):
+        # One slot per bucket plus the +Inf bucket, stored non cumulative
+        bucket_slots = [self._slot() for _ in range(len(buckets) + 1)]
+        slots = (buckets, bucket_slots, self._slot(), self._slot())
+        family.append((labels, slots))
+
+        return slots
+
+    def _observe(self, slots, buckets, value):
+        buckets, bucket_slots, sum_slot, count_slot = slots
+        values = self.values
+
+        values[bucket_slots[bisect.bisect_left(buckets, value)]] += 1
+        values[sum_slot] += value
+        values[count_slot] += 1
+
+    def _allocate(self):
+        size = self._size * 8
+
+        if self.directory is None:
+            return memoryview(bytearray(size)).cast('d')
+
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.db')
+        with open(path, 'wb+') as metrics_file:
+            metrics_file.truncate(size)
+            self._mmap = mmap.mmap(metrics_file.fileno(), size)
+
+        return memoryview(self._mmap).cast('d')
+
+    def _collect(self):
+        if self.directory is None:
+            return self.values
+
+        totals = [0.0] * self._size
+        gauges = set(self._gauges)
+
+        for path in glob.glob(os.path.join(self.directory, FILE_PATTERN)):
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.db')])
+            alive = pid == os.getpid() or _is_alive(pid)
+
+            with open(path, 'rb') as metrics_file:
+                data = metrics_file.read()
+
+            # Files of other code versions have another layout
+            if len(data) != self._size * 8:
+                continue
+
+            for slot, value in enumerate(memoryview(data).cast('d')):
+                if alive or slot not in gauges:
+                    totals[slot] += value
+
+        return totals
+
+
+def clear_metrics_directory(directory):
+    """Remove the metrics files of an earlier run."""
+
+    for path in glob.glob(os.path.join(directory, FILE_PATTERN)):
+        os.remove(path)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+
+    if float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
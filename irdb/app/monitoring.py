@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""Monitoring module.
+
+Module containing the listener of the MongoDB commands sent by the driver.
+It records the latency of every command per collection, logs slow commands
+by the shape of their filter and adds the database time of a request to its
+'Server-Timing' header.
+"""
+
+
+import contextvars
+import json
+import threading
+from collections import OrderedDict
+
+from pymongo import monitoring
+from tornado.log import app_log
+
+from .database import CONTENT_SCHEMAS, COUNTERS_COLLECTION
+
+
+# Collections getting their own latency histograms, others are counted
+# together as 'other'
+COLLECTIONS = tuple(CONTENT_SCHEMAS) + (COUNTERS_COLLECTION,)
+
+# Fields of a command that make up its shape, and the commands that can be
+# explained
+SHAPE_FIELDS = {
+    'find': ('filter', 'sort', 'projection'),
+    'aggregate': ('pipeline',),
+    'distinct': ('key', 'query'),
+    'count': ('query',),
+    'findAndModify': ('query', 'sort', 'update'),
+    'update': ('updates',),
+    'delete': ('deletes',),
+}
+EXPLAINABLE_COMMANDS = ('find', 'aggregate', 'distinct', 'count')
+
+# Fields added by the driver that cannot be part of an explained command
+DRIVER_FIELDS = ('lsid', 'txnNumber', 'autocommit', 'startTransaction')
+
+MAX_SLOW_QUERIES = 100
+
+# Database time of the request being handled. Motor runs the driver in
+# worker threads with a copy of the context, so the listener sees it.
+request_timing = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Database time of a single request."""
+
+    def __init__(self):
+        # Appending is atomic, so commands finishing in different worker
+        # threads need no lock
+        self.commands = []
+
+    def add(self, collection, duration):
+        self.commands.append((collection, duration))
+
+    def server_timing(self):
+        """Render the 'Server-Timing' header.
+
+        Returns:
+            str: Total database time and the time per collection in
+                milliseconds, None without commands
+
+        """
+
+        if not self.commands:
+            return None
+
+        collections = OrderedDict()
+        for collection, duration in self.commands:
+            collections[collection] = collections.get(collection, 0.0) + duration
+
+        total = sum(collections.values())
+        count = len(self.commands)
+        entries = [f'db;dur={total * 1000:.2f};desc="{count} command{"s" if count != 1 else ""}"']
+        entries.extend(f'db-{collection};dur={duration * 1000:.2f}' for collection, duration in collections.items())
+
+        return ', '.join(entries)
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Listener of the commands of a MotorClient.
+
+    The driver calls it from the worker threads of Motor, the latencies are
+    handed to the metrics and the slow commands are collected per shape. The
+    first time a shape of a read is slow it can be explained, the winning
+    plan is kept with the shape.
+    """
+
+    def __init__(self, metrics=None, slow_query_ms=100, explain=False, max_slow_queries=MAX_SLOW_QUERIES):
+        self.metrics = metrics
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.max_slow_queries = max_slow_queries
+
+        self._pending = {}
+        self._slow_queries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._io_loop = None
+        self._client = None
+
+    def start(self, io_loop, client):
+        """Enable explaining slow commands on the IOLoop with a MotorClient."""
+
+        self._io_loop = io_loop
+        self._client = client
+
+    def started(self, event):
+        collection = command_collection(event.command_name, event.command)
+        self._pending[event.request_id] = (collection, event.database_name, event.command, request_timing.get())
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def stats(self):
+        """Slow commands per shape, the slowest in total first.
+
+        Returns:
+            list: Command, collection, shape, count, total and maximum
+                milliseconds and the winning plan when explained
+
+        """
+
+        with self._lock:
+            entries = [dict(entry) for entry in self._slow_queries.values()]
+
+        return sorted(entries, key=lambda entry: -entry['total_ms'])
+
+    def _finished(self, event, failed):
+        pending = self._pending.pop(event.request_id, None)
+        if pending is None:
+            return
+
+        collection, database, command, timing = pending
+        duration = event.duration_micros / 1e6
+
+        if self.metrics is not None:
+            self.metrics.command_finished(event.command_name, collection, duration, failed)
+
+        if timing is not None:
+            timing.add(collection, duration)
+
+        if self.slow_query_ms and duration * 1000 >= self.slow_query_ms:
+            self._slow_command(event.command_name, collection, database, command, duration)
+
+    def _slow_command(self, command_name, collection, database, command, duration):
+        shape = json.dumps(command_shape(command_name, command))
+        milliseconds = duration * 1000
+
+        app_log.warning("Slow MongoDB %s on %s took %.1f ms: %s", command_name, collection, milliseconds, shape)
+
+        key = (command_name, collection, shape)
+        with self._lock:
+            entry = self._slow_queries.get(key)
+            new = entry is None
+
+            if new:
+                entry = {
+                    'command': command_name, 'collection': collection, 'shape': shape,
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'plan': None,
+                }
+                self._slow_queries[key] = entry
+
+                while len(self._slow_queries) > self.max_slow_queries:
+                    self._slow_queries.popitem(last=False)
+
+            entry['count'] += 1
+            entry['total_ms'] += milliseconds
+            entry['max_ms'] = max(entry['max_ms'], milliseconds)
+
+        if new and self.explain and self._io_loop is not None and command_name in EXPLAINABLE_COMMANDS:
+            self._io_loop.add_callback(self._explain, entry, database, command)
+
+    async def _explain(self, entry, database, command):
+        command = {name: value for name, value in command.items() if not name.startswith('$') and name not in DRIVER_FIELDS}
+
+        try:
+            result = await self._client[database].command({'explain': command, 'verbosity': 'queryPlanner'})
+
+        except Exception as e:
+            app_log.error("Could not explain slow MongoDB %s on %s: %s", entry['command'], entry['collection'], e)
+            return
+
+        entry['plan'] = plan_summary(result)
+        app_log.warning("Plan of slow MongoDB %s on %s %s: %s", entry['command'], entry['collection'], entry['shape'], entry['plan'])
+
+
+def command_collection(command_name, command):
+    """Name of the collection a command runs on.
+
+    Returns:
+        str: Collection, 'other' when it is not one of COLLECTIONS
+
+    """
+
+    collection = command.get('collection') if command_name == 'getMore' else command.get(command_name)
+
+    return collection if collection in COLLECTIONS else 'other'
+
+
+def command_shape(command_name, command):
+    """Shape of a command, its filter with all values redacted.
+
+    Returns:
+        dict: Fields making up the shape of the command
+
+    """
+
+    fields = SHAPE_FIELDS.get(command_name, ())
+
+    return {field: redact(command[field]) for field in fields if field in command}
+
+
+def redact(value):
+    """Replace all values in a document by '?', keeping the field names and
+    operators. Lists keep one entry per distinct shape, so `$in` lists of any
+    length have the same shape.
+    """
+
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+
+        return shapes
+
+    return '?'
+
+
+def plan_summary(explain_result):
+    """Summarize the winning plan of an explain result.
+
+    Returns:
+        str: Stages of the winning plan from the outermost one, with the
+            names of the used indexes, like 'FETCH > IXSCAN Year_1'
+
+    """
+
+    stages = []
+    pending = [_find_winning_plan(explain_result)]
+
+    while pending:
+        stage = pending.pop(0)
+        if not isinstance(stage, dict):
+            continue
+
+        name = stage.get('stage', '?')
+        if 'indexName' in stage:
+            name = f"{name} {stage['indexName']}"
+        stages.append(name)
+
+        pending.extend(stage.get('inputStages', []))
+        if 'inputStage' in stage:
+            pending.append(stage['inputStage'])
+
+    return ' > '.join(stages)
+
+
+def _find_winning_plan(document):
+    # Aggregations nest the plan of their cursor stage in 'stages'
+    if isinstance(document, dict):
+        if 'winningPlan' in document:
+            return document['winningPlan'].get('queryPlan', document['winningPlan'])
+
+        values = document.values()
+
+    elif isinstance(document, list):
+        values = document
+
+    else:
+        return None
+
+    for value in values:
+        plan = _find_winning_plan(value)
+        if plan is not None:
+            return plan
+
+    return None
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Profiling module.
+
+Module containing the opt-in profiling of Request Handlers. A profiled
+request runs its handler method under cProfile, the profiler is only
+enabled while the coroutine of that request is running, so other requests
+served in between do not end up in its profile. Profiles are kept in a
+bounded ring buffer and can be exported for pstats or as collapsed stacks
+for flamegraphs.
+"""
+
+
+import cProfile
+import functools
+import inspect
+import itertools
+import marshal
+import random
+import time
+from collections import deque, namedtuple
+
+
+MAX_PROFILES = 20
+
+# Deepest stack written to the collapsed stacks, deeper frames are cut off
+MAX_STACK_DEPTH = 64
+
+RequestProfile = namedtuple('RequestProfile', ['id', 'profile'])
+ProfileRecord = namedtuple(
+    'ProfileRecord', ['id', 'created', 'handler', 'method', 'uri', 'status', 'duration_ms', 'stats'],
+)
+
+
+class Profiler:
+    """Profiles of sampled and requested requests in a ring buffer."""
+
+    def __init__(self, max_profiles=MAX_PROFILES, sample_rate=0.0, clock=time.time, random=random.random):
+        self.sample_rate = sample_rate
+        self._clock = clock
+        self._random = random
+
+        self._profiles = deque(maxlen=max_profiles)
+        self._ids = itertools.count(1)
+
+    def sampled(self):
+        """Whether to profile a request that did not ask for it."""
+
+        return self.sample_rate > 0 and self._random() < self.sample_rate
+
+    def start(self):
+        """Start the profile of a request.
+
+        Returns:
+            obj: RequestProfile with the Id the profile is stored under
+
+        """
+
+        return RequestProfile(next(self._ids), cProfile.Profile())
+
+    def wrap(self, method, request_profile):
+        """Wrap a handler method to run under the profiler of a request."""
+
+        profile = request_profile.profile
+
+        @functools.wraps(method)
+        async def profiled(*args, **kwargs):
+            profile.enable()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                profile.disable()
+
+            if inspect.iscoroutine(result):
+                return await _ProfiledCoroutine(result, profile)
+
+            if result is not None:
+                return await result
+
+            return result
+
+        return profiled
+
+    def add(self, request_profile, handler, method, uri, status, duration):
+        """Store a finished profile, dropping the oldest one when full."""
+
+        profile = request_profile.profile
+        profile.create_stats()
+
+        self._profiles.append(ProfileRecord(
+            request_profile.id, self._clock(), handler, method, uri, status, round(duration * 1000, 3), profile.stats,
+        ))
+
+    def get(self, profile_id):
+        for record in self._profiles:
+            if record.id == profile_id:
+                return record
+
+        return None
+
+    def summaries(self):
+        """Summaries of the stored profiles, the newest first.
+
+        Returns:
+            list: Profiles without their stats
+
+        """
+
+        return [
+            {field: value for field, value in record._asdict().items() if field != 'stats'}
+            for record in reversed(self._profiles)
+        ]
+
+
+class _ProfiledCoroutine:
+    # Drives a coroutine one step at a time with the profiler enabled only
+    # while the coroutine itself runs
+
+    def __init__(self, coroutine, profile):
+        self.coroutine = coroutine
+        self.profile = profile
+
+    def __await__(self):
+        coroutine = self.coroutine
+        value, error = None, None
+
+        while True:
+            self.profile.enable()
+            try:
+                if error is not None:
+                    yielded = coroutine.throw(error)
+                else:
+                    yielded = coroutine.send(value)
+
+            except StopIteration as e:
+                return e.value
+
+            finally:
+                self.profile.disable()
+
+            try:
+                value, error = (yield yielded), None
+
+            except GeneratorExit:
+                coroutine.close()
+                raise
+
+            except BaseException as e:
+                value, error = None, e
+
+
+def pstats_dump(record):
+    """Serialize a profile in the format of `pstats.Stats.dump_stats`.
+
+    Returns:
+        bytes: Profile loadable with `pstats.Stats(path)`
+
+    """
+
+    return marshal.dumps(record.stats)
+
+
+def collapsed_stacks(record):
+    """Convert a profile into collapsed stacks for flamegraph tools.
+
+    cProfile only records callers and callees, not complete stacks. The
+    stacks are rebuilt from the call graph, the time of a function called
+    from several places is split by the time spent under each caller.
+
+    Returns:
+        str: Lines of ';' separated frames and microseconds of own time
+
+    """
+
+    stats = record.stats
+    children = {}
+    roots = []
+
+    for function, (cc, nc, tt, ct, callers) in stats.items():
+        known_callers = [caller for caller in callers if caller in stats]
+        if not known_callers:
+            roots.append(function)
+
+        for caller in known_callers:
+            children.setdefault(caller, []).append((function, callers[caller][3]))
+
+    lines = {}
+
+    def walk(function, stack, share):
+        stack = stack + (function,)
+        cc, nc, tt, ct, callers = stats[function]
+
+        own = int(tt * share * 1e6)
+        if own:
+            key = ';'.join(_frame_name(frame) for frame in stack)
+            lines[key] = lines.get(key, 0) + own
+
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+
+        for child, edge_time in children.get(function, ()):
+            child_time = stats[child][3]
+            if child in stack or not child_time:
+                continue
+
+            walk(child, stack, share * edge_time / child_time)
+
+    for root in roots:
+        walk(root, (), 1.0)
+
+    return ''.join(f'{stack} {value}\n' for stack, value in sorted(lines.items()))
+
+
+def _frame_name(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-in functions
+        return name
+
+    return f'{name} ({filename.rsplit("/", 1)[-1]}:{line})'
@@ -1,5 +1,19 @@
 """Schemas module"""
-from marshmallow import Schema, fields, validate
+from marshmallow import RAISE, Schema, fields, validate
+
+
+class StrictString(fields.String):
+    """A string field that only accepts text.
+
+    marshmallow also accepts bytes for strings, which msgpack bodies can
+    send. They can not be stored as text or hashed, so they are invalid.
+    """
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if not isinstance(value, str):
+            raise self.make_error("invalid")
+
+        return value
 
 
 class BaseSchema(Schema):
@@ -55,7 +69,7 @@ class ArtistSchema(BaseSchema):
         }
     )
 
-    Name = fields.Str(
+    Name = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -96,7 +110,7 @@ class SongSchema(BaseSchema):
         }
     )
 
-    Name = fields.Str(
+    Name = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -114,7 +128,7 @@ class SongSchema(BaseSchema):
         },
     )
 
-    Artist = fields.Str(
+    Artist = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -123,7 +137,7 @@ class SongSchema(BaseSchema):
         },
     )
 
-    Shortname = fields.Str(
+    Shortname = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -150,7 +164,7 @@ class SongSchema(BaseSchema):
         },
     )
 
-    Genre = fields.Str(
+    Genre = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -159,7 +173,7 @@ class SongSchema(BaseSchema):
         },
     )
 
-    SpotifyId = fields.Str(
+    SpotifyId = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -168,7 +182,7 @@ class SongSchema(BaseSchema):
         },
     )
 
-    Album = fields.Str(
+    Album = StrictString(
         metadata={
             "required": True,
             "metadata": {
@@ -193,4 +207,249 @@ class SongCreateSuccessSchema(BaseSuccessSchema):
                 "description": "Validated and newly created Rock Song information"
             }
         }
-    )
\ No newline at end of file
+    )
+
+
+class BulkCreateItemSchema(BaseSchema):
+    index = fields.Int(
+        metadata={
+            "required": True,
+            "metadata": {
+                "description": "Position of the item in the request body",
+                "example": 0}
+        }
+    )
+
+    status = fields.Int(
+        metadata={
+            "required": True,
+            "metadata": {
+                "description": "201 when created, 200 when it duplicates an existing item, 400 when invalid",
+                "example": 201}
+        }
+    )
+
+    Id = fields.Int(
+        metadata={
+            "required": False,
+            "metadata": {
+                "description": "Id of the created or duplicated item",
+                "example": 760}
+        }
+    )
+
+    errors = fields.Dict(
+        metadata={
+            "required": False,
+            "metadata": {
+                "description": "Validation errors of the item",
+                "example": {"Name": ["Not a valid string."]}
+            }
+        }
+    )
+
+
+class BulkCreateResultSchema(BaseSchema):
+    success = fields.Boolean(
+        metadata={
+            "required": True,
+            "metadata": {
+                "description": 'This is "True" when no item failed',
+                "example": True
+            }
+        }
+    )
+
+    results = fields.List(
+        fields.Nested(BulkCreateItemSchema),
+        metadata={
+            "required": True,
+            "metadata": {
+                "description": "Status per item, in request order"
+            }
+        }
+    )
+
+
+# Python types a value must have exactly to pass the fast path per field
+# type. Fields of other types make the whole schema use marshmallow only.
+FAST_PATH_TYPES = {
+    fields.Integer: 'int',
+    fields.String: 'str',
+    StrictString: 'str',
+    fields.Boolean: 'bool',
+}
+
+
+class Validator:
+    """Validator of request bodies built once per schema.
+
+    A fast path is generated from the field definitions, it only accepts
+    values that certainly pass marshmallow, like exact types and simple
+    validators. Everything else goes through marshmallow, which also gives
+    the error messages.
+    """
+
+    def __init__(self, schema_class):
+        self.schema = schema_class()
+        self.many_schema = schema_class(many=True)
+        self.is_valid = compile_fast_path(self.schema)
+
+    def validate(self, data):
+        """Validate a single document.
+
+        Returns:
+            dict: Validation errors, empty when valid
+
+        """
+
+        if self.is_valid is not None and self.is_valid(data):
+            return {}
+
+        return self.schema.validate(data)
+
+    def validate_many(self, items):
+        """Validate a list of documents.
+
+        Returns:
+            dict: Validation errors keyed by position, empty when all are
+                valid
+
+        """
+
+        if self.is_valid is not None and all(map(self.is_valid, items)):
+            return {}
+
+        return self.many_schema.validate(items)
+
+    def parse(self, body, loads, many=False, max_items=None):
+        """Parse a request body and validate it in one step.
+
+        Args:
+            body (bytes): Request body
+            loads (callable): Parser of the body
+            many (bool): Validate a list as a batch of documents
+            max_items (int): Longest list that is validated, longer lists
+                are returned without validation errors for the caller to
+                reject
+
+        Returns:
+            tuple: Parsed data and its validation errors
+
+        Raises:
+            ValueError: When the body can not be parsed
+
+        """
+
+        data = loads(body)
+
+        if many and isinstance(data, list):
+            if max_items is not None and len(data) > max_items:
+                return data, {}
+
+            return data, self.validate_many(data)
+
+        return data, self.validate(data)
+
+
+def compile_fast_path(schema):
+    """Generate the fast path validation function of a schema.
+
+    Args:
+        schema (obj): Marshmallow schema instance
+
+    Returns:
+        callable: Function returning True for data that is certainly valid,
+            or None when the schema uses features the fast path can not check
+
+    """
+
+    if any(schema._hooks.values()):
+        return None
+
+    lines = [
+        'def is_valid(data):',
+        '    if type(data) is not dict:',
+        '        return False',
+    ]
+    namespace = {'MISSING': object()}
+
+    if schema.unknown == RAISE:
+        namespace['KEYS'] = frozenset(field.data_key or name for name, field in schema.fields.items())
+        lines += [
+            '    if not KEYS.issuperset(data):',
+            '        return False',
+        ]
+
+    for name, field in schema.fields.items():
+        value_type = FAST_PATH_TYPES.get(type(field))
+        if value_type is None:
+            return None
+
+        conditions = [f'type(value) is not {value_type}']
+        for position, validator in enumerate(field.validators):
+            condition = _validator_condition(validator, f'V{len(namespace)}_{position}', namespace)
+            if condition is None:
+                return None
+
+            conditions.append(condition)
+
+        key = repr(field.data_key or name)
+        lines.append(f'    value = data.get({key}, MISSING)')
+
+        if field.required:
+            lines += [
+                '    if value is MISSING:',
+                '        return False',
+            ]
+
+        skip = 'value is not MISSING'
+        if field.allow_none:
+            skip += ' and value is not None'
+
+        lines += [
+            f'    if {skip} and ({" or ".join(conditions)}):',
+            '        return False',
+        ]
+
+    lines.append('    return True')
+
+    exec(compile('\n'.join(lines), f'<fast path {type(schema).__name__}>', 'exec'), namespace)
+
+    return namespace['is_valid']
+
+
+def _validator_condition(validator, name, namespace):
+    # Condition failing the value, None for validators the fast path lacks
+    if isinstance(validator, validate.Length):
+        if validator.equal is not None:
+            return f'len(value) != {validator.equal!r}'
+
+        bounds = []
+        if validator.min is not None:
+            bounds.append(f'len(value) < {validator.min!r}')
+        if validator.max is not None:
+            bounds.append(f'len(value) > {validator.max!r}')
+
+        return ' or '.join(bounds) or 'False'
+
+    if isinstance(validator, validate.Range):
+        bounds = []
+        if validator.min is not None:
+            bounds.append(f'value {"<" if validator.min_inclusive else "<="} {validator.min!r}')
+        if validator.max is not None:
+            bounds.append(f'value {">" if validator.max_inclusive else ">="} {validator.max!r}')
+
+        return ' or '.join(bounds) or 'False'
+
+    if isinstance(validator, validate.OneOf):
+        namespace[name] = frozenset(validator.choices)
+        return f'value not in {name}'
+
+    return None
+
+
+VALIDATORS = {
+    'artists': Validator(ArtistSchema),
+    'songs': Validator(SongSchema),
+}
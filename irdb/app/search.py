@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Search module.
+
+Module containing the in-process inverted index used for ranked and typo
+tolerant search on artists and songs.
+"""
+
+
+import bisect
+import math
+import re
+import unicodedata
+from collections import defaultdict
+
+from tornado.locks import Lock
+from tornado.log import app_log
+
+from .database import PUBLIC_PROJECTION
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Fields that are searchable per collection and their weight in the ranking
+SEARCH_FIELDS = {
+    'artists': {'Name': 3.0},
+    'songs': {'Name': 3.0, 'Artist': 2.0, 'Album': 1.0, 'Genre': 1.0},
+}
+
+# Minimal trigram similarity for a term to count as a typo of a query term
+FUZZY_THRESHOLD = 0.3
+FUZZY_EXPANSIONS = 3
+PREFIX_EXPANSIONS = 50
+
+
+def tokenize(text):
+    """Split text into lowercase tokens without accents.
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        list: Tokens
+
+    """
+
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+
+    return TOKEN_PATTERN.findall(text)
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Inverted index over the text fields of a single collection.
+
+    Keeps term postings for ranking, trigram postings on the vocabulary for
+    typo tolerance and a sorted vocabulary for prefix (autocomplete)
+    lookups. The indexed documents are kept as well, so a search never
+    touches the database.
+
+    Writes are applied with `apply_write`. Writes made while the index is
+    loading are replayed when the load is done, the load may have read the
+    documents before the writes.
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.loaded = False
+        self._load_lock = Lock()
+
+        # Writes made while loading, and the index being rebuilt to replace
+        # this one which gets them as well
+        self._writes = None
+        self.replacement = None
+
+        self._documents = {}
+        self._postings = defaultdict(dict)
+        self._trigrams = defaultdict(set)
+        self._terms = []
+
+    def __len__(self):
+        return len(self._documents)
+
+    async def load(self, collection, batch_size=1000):
+        """(Re)build the index from all documents in a collection.
+
+        Args:
+            collection (obj): Motor collection
+            batch_size (int): Cursor batch size
+
+        """
+
+        cursor = collection.find({}, PUBLIC_PROJECTION).batch_size(batch_size)
+        self._writes = []
+
+        try:
+            async for document in cursor:
+                self.add(document)
+
+            for document, doc_id in self._writes:
+                self._apply(document, doc_id)
+
+            self.loaded = True
+
+        finally:
+            self._writes = None
+
+    async def ensure_loaded(self, collection):
+        """Build the index from the collection unless that already happened."""
+
+        async with self._load_lock:
+            if not self.loaded:
+                await self.load(collection)
+
+    def apply_write(self, document=None, doc_id=None):
+        """Apply a write made to the collection.
+
+        Args:
+            document (dict): New version of a document, when it was written
+            doc_id (int): Id of a document, when it was deleted
+
+        """
+
+        if self.replacement is not None:
+            self.replacement.apply_write(document, doc_id)
+
+        if self._writes is not None:
+            self._writes.append((document, doc_id))
+
+        # An index that is not loaded yet reads the write when loading
+        if self.loaded:
+            self._apply(document, doc_id)
+
+    def _apply(self, document, doc_id):
+        if document is not None:
+            self.add(document)
+        else:
+            self.remove(doc_id)
+
+    def add(self, document):
+        """Add a document to the index, replacing an earlier version."""
+
+        doc_id = document['Id']
+        if doc_id in self._documents:
+            self.remove(doc_id)
+
+        self._documents[doc_id] = document
+
+        for field, weight in self.fields.items():
+            value = document.get(field)
+            if value is None:
+                continue
+
+            for term in tokenize(value):
+                postings = self._postings[term]
+                if not postings:
+                    self._add_term(term)
+
+                postings[doc_id] = postings.get(doc_id, 0.0) + weight
+
+    def remove(self, doc_id):
+        """Remove a document from the index."""
+
+        document = self._documents.pop(doc_id, None)
+        if document is None:
+            return
+
+        for field in self.fields:
+            value = document.get(field)
+            if value is None:
+                continue
+
+            for term in tokenize(value):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+
+                postings.pop(doc_id, None)
+                if not postings:
+                    self._remove_term(term)
+
+    def search(self, query, limit=10, prefix=False):
+        """Find the best matching documents for a query.
+
+        Every query token is matched exactly, and otherwise against terms
+        with a similar trigram set (typos). In prefix mode the last token
+        also matches all terms it is a prefix of.
+
+        Args:
+            query (str): Search query
+            limit (int): Maximum number of hits
+            prefix (bool): Treat the last query token as a prefix
+
+        Returns:
+            list: Tuples of score and document, best match first
+
+        """
+
+        tokens = tokenize(query)
+        scores = defaultdict(float)
+
+        for position, token in enumerate(tokens):
+            expansions = self._expand(token, prefix=prefix and position == len(tokens) - 1)
+
+            for term, similarity in expansions.items():
+                postings = self._postings[term]
+                idf = math.log(1 + len(self._documents) / len(postings))
+
+                for doc_id, weight in postings.items():
+                    scores[doc_id] += similarity * idf * weight
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+        return [(round(score, 4), self._documents[doc_id]) for doc_id, score in best]
+
+    def _expand(self, token, prefix=False):
+        expansions = {}
+
+        if token in self._postings:
+            expansions[token] = 1.0
+
+        if prefix:
+            start = bisect.bisect_left(self._terms, token)
+            for term in self._terms[start:start + PREFIX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+
+                # Favour completions close to the typed length
+                expansions.setdefault(term, len(token) / len(term))
+
+        if not expansions:
+            expansions = self._fuzzy(token)
+
+        return expansions
+
+    def _fuzzy(self, token):
+        token_trigrams = trigrams(token)
+
+        overlap = defaultdict(int)
+        for trigram in token_trigrams:
+            for term in self._trigrams.get(trigram, ()):
+                overlap[term] += 1
+
+        candidates = {}
+        for term, shared in overlap.items():
+            similarity = shared / (len(token_trigrams) + len(trigrams(term)) - shared)
+            if similarity >= FUZZY_THRESHOLD:
+                candidates[term] = similarity
+
+        best = sorted(candidates.items(), key=lambda item: -item[1])[:FUZZY_EXPANSIONS]
+
+        return dict(best)
+
+    def _add_term(self, term):
+        bisect.insort(self._terms, term)
+        for trigram in trigrams(term):
+            self._trigrams[trigram].add(term)
+
+    def _remove_term(self, term):
+        del self._postings[term]
+
+        position = bisect.bisect_left(self._terms, term)
+        if position < len(self._terms) and self._terms[position] == term:
+            del self._terms[position]
+
+        for trigram in trigrams(term):
+            terms = self._trigrams.get(trigram)
+            if terms is not None:
+                terms.discard(term)
+                if not terms:
+                    del self._trigrams[trigram]
+
+
+def make_search_indexes():
+    """Make an empty search index for every searchable collection.
+
+    Returns:
+        dict: Collection names mapped to their SearchIndex
+
+    """
+
+    return {collection: SearchIndex(fields) for collection, fields in SEARCH_FIELDS.items()}
+
+
+async def refresh_search_indexes(indexes, db):
+    """Rebuild the search indexes from the database.
+
+    Every worker process keeps its own indexes and only sees its own writes,
+    a periodic refresh picks up the writes of the other workers. A new index
+    is built next to the old one and swapped in when complete, so searches
+    keep being answered in the meantime. Writes handled by this worker
+    during the rebuild are applied to both.
+
+    Args:
+        indexes (dict): Collection names mapped to their SearchIndex
+        db (obj): Motor database
+
+    """
+
+    for collection, index in list(indexes.items()):
+        fresh = SearchIndex(index.fields)
+
+        # Writes handled during the rebuild reach the new index too
+        index.replacement = fresh
+
+        try:
+            await fresh.load(db[collection])
+
+        except Exception as e:
+            app_log.error("Could not refresh the search index of %s: %s", collection, e)
+            continue
+
+        finally:
+            index.replacement = None
+
+        indexes[collection] = fresh
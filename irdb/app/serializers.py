@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Serializers module.
+
+Module containing the formats used to encode responses and decode request
+bodies. JSON is always available, the fastest installed JSON backend is used
+unless one is asked for explicitly. MessagePack is available when installed.
+"""
+
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+# Content types that are commonly used for MessagePack as well
+MSGPACK_ALIASES = ('application/x-msgpack', 'application/vnd.msgpack')
+
+
+class Serializer:
+    """Format with a bytes producing `dumps` and a `loads`."""
+
+    def __init__(self, name, content_type, dumps, loads):
+        self.name = name
+        self.content_type = content_type
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r})'
+
+
+class JsonSerializer(Serializer):
+    """JSON backend with a bytes producing `dumps` and a `loads`."""
+
+    def __init__(self, name, dumps, loads):
+        super().__init__(name, JSON_CONTENT_TYPE, dumps, loads)
+
+
+def _stdlib_dumps(data):
+    return json.dumps(data).encode('utf-8')
+
+
+JSON_SERIALIZERS = {
+    'json': JsonSerializer('json', _stdlib_dumps, json.loads),
+}
+
+if ujson is not None:
+    JSON_SERIALIZERS['ujson'] = JsonSerializer(
+        'ujson', lambda data: ujson.dumps(data, ensure_ascii=False).encode('utf-8'), ujson.loads)
+
+if orjson is not None:
+    JSON_SERIALIZERS['orjson'] = JsonSerializer('orjson', orjson.dumps, orjson.loads)
+
+# Order of preference when no backend is asked for
+PREFERRED_JSON_SERIALIZERS = ('orjson', 'ujson', 'json')
+
+
+def get_json_serializer(name=None):
+    """Get a JSON serializer.
+
+    Args:
+        name (str): Name of the backend, by default the fastest installed one
+
+    Returns:
+        obj: JsonSerializer
+
+    Raises:
+        ValueError: When the requested backend is not installed
+
+    """
+
+    if name is not None:
+        try:
+            return JSON_SERIALIZERS[name]
+        except KeyError:
+            raise ValueError(f"JSON backend '{name}' is not available, choose from {', '.join(JSON_SERIALIZERS)}")
+
+    for name in PREFERRED_JSON_SERIALIZERS:
+        if name in JSON_SERIALIZERS:
+            return JSON_SERIALIZERS[name]
+
+
+if msgpack is not None:
+    MSGPACK_SERIALIZER = Serializer(
+        'msgpack',
+        MSGPACK_CONTENT_TYPE,
+        lambda data: msgpack.packb(data, use_bin_type=True),
+        lambda body: msgpack.unpackb(body, raw=False),
+    )
+else:
+    MSGPACK_SERIALIZER = None
+
+
+def make_serializers(json_serializer):
+    """Make the registry of the formats the API speaks.
+
+    Args:
+        json_serializer (obj): JsonSerializer used for JSON
+
+    Returns:
+        dict: Content types mapped to their Serializer, JSON first as it is
+            the default
+
+    """
+
+    serializers = {JSON_CONTENT_TYPE: json_serializer}
+
+    if MSGPACK_SERIALIZER is not None:
+        serializers[MSGPACK_CONTENT_TYPE] = MSGPACK_SERIALIZER
+        for alias in MSGPACK_ALIASES:
+            serializers[alias] = MSGPACK_SERIALIZER
+
+    return serializers
+
+
+def negotiate(accept, serializers):
+    """Pick the format for a response from an Accept header.
+
+    Media ranges are tried by their quality, types the API does not speak
+    are skipped. Without an acceptable format JSON is used, so clients
+    sending a browser like header still get a response.
+
+    Args:
+        accept (str): Accept header of the request
+        serializers (dict): Content types mapped to their Serializer
+
+    Returns:
+        obj: Serializer
+
+    """
+
+    default = next(iter(serializers.values()))
+    if not accept:
+        return default
+
+    ranges = []
+    for position, media_range in enumerate(accept.split(',')):
+        content_type, *parameters = media_range.split(';')
+        quality = 1.0
+
+        for parameter in parameters:
+            name, _, value = parameter.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        if quality > 0:
+            ranges.append((-quality, position, content_type.strip().lower()))
+
+    for _, _, content_type in sorted(ranges):
+        if content_type in serializers:
+            return serializers[content_type]
+
+        if content_type in ('*/*', 'application/*'):
+            return default
+
+    return default
@@ -1,16 +1,59 @@
+import hashlib
 import json
+import os
 
-from apispec import APISpec
-from apispec.exceptions import APISpecError
-from apispec.ext.marshmallow import MarshmallowPlugin
-from apispec_webframeworks.tornado import TornadoPlugin
+from marshmallow import Schema
+from tornado.routing import Router
+from tornado.web import Application
+
+# Top level key of the Swagger file holding the hash it was generated for
+SPEC_HASH_KEY = "x-spec-hash"
+
+
+def spec_hash(handlers):
+    """Hash everything the Swagger spec is generated from.
+
+    Covers the URL patterns and docstrings of the handlers and the
+    definitions of all marshmallow schemas.
+    """
+
+    parts = []
+
+    for pattern, handler, *_ in handlers:
+        parts.append(pattern)
+        parts.extend(getattr(handler, method.lower()).__doc__ or "" for method in handler.SUPPORTED_METHODS)
+
+    schemas = []
+    pending = [Schema]
+    while pending:
+        schema = pending.pop()
+        pending.extend(schema.__subclasses__())
+        schemas.append(schema)
+
+    for schema in sorted(schemas, key=lambda schema: f"{schema.__module__}.{schema.__qualname__}"):
+        parts.append(f"{schema.__module__}.{schema.__qualname__}")
+        for name, field in schema._declared_fields.items():
+            parts.append(json.dumps([
+                name, type(field).__name__, field.required, field.allow_none, field.metadata,
+                [repr(validator) for validator in field.validators],
+            ], sort_keys=True, default=str))
+
+    return hashlib.sha1("\n".join(parts).encode("utf-8")).hexdigest()
 
 
 def generate_swagger_file(handlers, file_location):
     """Automatically generates Swagger spec file based on RequestHandler
     docstrings and saves it to the specified file_location.
+
+    Returns the spec, which holds the hash of its sources under SPEC_HASH_KEY.
     """
 
+    # The documentation stack is only needed when the spec is (re)generated
+    from apispec import APISpec
+    from apispec.exceptions import APISpecError
+    from apispec.ext.marshmallow import MarshmallowPlugin
+    from apispec_webframeworks.tornado import TornadoPlugin
+
     # Starting to generate Swagger spec file. All the relevant
     # information can be found from here https://apispec.readthedocs.io/
     spec = APISpec(
@@ -32,6 +75,57 @@ def generate_swagger_file(handlers, file_location):
         except APISpecError:
             pass
 
+    spec = spec.to_dict()
+    spec[SPEC_HASH_KEY] = spec_hash(handlers)
+
     # Write the Swagger file into specified location.
     with open(file_location, "w", encoding="utf-8") as file:
-        json.dump(spec.to_dict(), file, ensure_ascii=False, indent=4)
\ No newline at end of file
+        json.dump(spec, file, ensure_ascii=False, indent=4)
+
+    return spec
+
+
+def load_swagger_file(handlers, file_location):
+    """Load the Swagger spec file, regenerating it when it is missing or was
+    generated from other handlers or schemas.
+    """
+
+    if os.path.isfile(file_location):
+        with open(file_location, encoding="utf-8") as file:
+            try:
+                spec = json.load(file)
+            except ValueError:
+                spec = {}
+
+        if spec.get(SPEC_HASH_KEY) == spec_hash(handlers):
+            return spec
+
+    return generate_swagger_file(handlers, file_location)
+
+
+class SwaggerRouter(Router):
+    """Router serving the Swagger UI, set up on the first request.
+
+    Loading the spec and importing the documentation stack only happens
+    when the documentation is requested, so it does not slow down starting
+    the application.
+    """
+
+    def __init__(self, handlers, file_location, url_prefix, title):
+        self.handlers = handlers
+        self.file_location = file_location
+        self.url_prefix = url_prefix
+        self.title = title
+        self._application = None
+
+    def find_handler(self, request, **kwargs):
+        if self._application is None:
+            import swagger_ui
+
+            spec = load_swagger_file(self.handlers, self.file_location)
+
+            application = Application()
+            swagger_ui.tornado_api_doc(application, config=spec, url_prefix=self.url_prefix, title=self.title)
+            self._application = application
+
+        return self._application.find_handler(request, **kwargs)
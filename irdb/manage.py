@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Management commands.
+
+Module with maintenance commands for the database behind the API.
+
+Usage:
+    python manage.py backfill-hashes
+    python manage.py ensure-indexes
+    python manage.py build-docs
+"""
+
+
+import argparse
+
+import tornado.ioloop
+
+try:
+    from .app.database import CONTENT_SCHEMAS, backfill_content_hashes, ensure_indexes
+    from .init_swagger import load_swagger_file
+    from .irdb import SWAGGER_API_OUTPUT_FILE, make_db, make_handlers
+
+except:
+    from app.database import CONTENT_SCHEMAS, backfill_content_hashes, ensure_indexes
+    from init_swagger import load_swagger_file
+    from irdb import SWAGGER_API_OUTPUT_FILE, make_db, make_handlers
+
+
+async def backfill_hashes(db, args):
+    """Store content hashes on existing documents and create the indexes."""
+
+    for collection in CONTENT_SCHEMAS:
+        updated, duplicates = await backfill_content_hashes(db, collection, batch_size=args.batch_size)
+        print(f'{collection}: hashed {updated} documents')
+
+        if duplicates:
+            print(f'{collection}: documents with duplicate content (Ids): {duplicates}')
+
+    await ensure_indexes(db)
+
+
+async def create_indexes(db, args):
+    """Create all indexes used by the API."""
+
+    await ensure_indexes(db)
+
+
+async def build_docs(db, args):
+    """Build the Swagger spec file unless it is up to date."""
+
+    spec = load_swagger_file(make_handlers(), SWAGGER_API_OUTPUT_FILE)
+    print(f'{SWAGGER_API_OUTPUT_FILE}: {len(spec["paths"])} paths')
+
+
+COMMANDS = {
+    'backfill-hashes': backfill_hashes,
+    'ensure-indexes': create_indexes,
+    'build-docs': build_docs,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Internet Rock Database management commands")
+    parser.add_argument('command', choices=COMMANDS)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    db = make_db()
+    command = COMMANDS[args.command]
+    tornado.ioloop.IOLoop.current().run_sync(lambda: command(db, args))
+
+
+if __name__ == "__main__":
+    main()
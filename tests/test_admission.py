@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from tornado import gen
+
+from irdb.app.admission import QUEUE_FULL, READ, TIMEOUT, WRITE, AdmissionController, Budget, Limiter
+
+
+@pytest.mark.gen_test
+def test_limiter_queues_and_rejects_when_full():
+    limiter = Limiter(max_concurrency=1, max_queue=1, queue_timeout=1.0)
+
+    assert (yield limiter.acquire()) is None
+    waiting = asyncio.ensure_future(limiter.acquire())
+    yield gen.moment
+
+    assert (yield limiter.acquire()) == QUEUE_FULL
+    assert limiter.queued == 1
+
+    # The finishing request hands its slot to the waiting one
+    limiter.release()
+    assert (yield waiting) is None
+    assert limiter.stats()['active'] == 1
+
+    limiter.release()
+    assert limiter.stats()['active'] == 0
+
+
+@pytest.mark.gen_test
+def test_limiter_times_out_waiting_requests():
+    limiter = Limiter(max_concurrency=1, max_queue=5, queue_timeout=0.01)
+
+    yield limiter.acquire()
+
+    assert (yield limiter.acquire()) == TIMEOUT
+    assert limiter.queued == 0
+    assert limiter.stats()['rejected'] == {'queue_full': 0, 'timeout': 1}
+
+
+@pytest.mark.gen_test
+def test_limiter_cancelled_waiter_gives_up_its_place():
+    limiter = Limiter(max_concurrency=1, max_queue=5, queue_timeout=1.0)
+
+    yield limiter.acquire()
+    waiting = asyncio.ensure_future(limiter.acquire())
+    yield gen.moment
+
+    waiting.cancel()
+    yield gen.moment
+    limiter.release()
+
+    assert limiter.queued == 0
+    assert limiter.active == 0
+
+
+@pytest.mark.gen_test
+def test_admission_controller_has_separate_read_and_write_budgets():
+    admission = AdmissionController({READ: Budget(1, 0, 1.0), WRITE: Budget(0, 0, 1.0)})
+
+    limiter, reason = yield admission.admit('SongsHandler', 'GET')
+    assert limiter is not None and reason is None
+
+    assert (yield admission.admit('SongsHandler', 'GET')) == (None, QUEUE_FULL)
+    assert (yield admission.admit('ArtistsHandler', 'GET'))[1] is None
+
+    # Unlimited budget
+    assert (yield admission.admit('SongsHandler', 'POST')) == (None, None)
+    assert admission.retry_after('GET') == 1
@@ -2,6 +2,8 @@ import pytest
 import json
 import tornado
 
+from irdb.app.serializers import MSGPACK_SERIALIZER
+
 
 @pytest.fixture
 def artists_base_url(base_url):
@@ -19,6 +21,18 @@ def test_artist_handler_get(http_client, artists_base_url):
     assert json_result == artist
 
 
+@pytest.mark.skipif(MSGPACK_SERIALIZER is None, reason='msgpack is not installed')
+@pytest.mark.gen_test
+def test_artists_handler_post_rejects_msgpack_bytes(http_client, artists_base_url):
+    body = MSGPACK_SERIALIZER.dumps({"Name": b"Def Leppard"})
+    headers = {'Content-Type': 'application/msgpack'}
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(artists_base_url, method="POST", body=body, headers=headers)
+
+    assert error.value.code == 400
+
+
 @pytest.mark.gen_test
 def test_artists_handler_create_new_post_fails_malformed_data(http_client, artists_base_url):
     test_data = {"Named": "Rock Stars"}
@@ -53,3 +67,16 @@ def test_artists_handler_create_new_post(http_client, artists_base_url):
 #     with pytest.raises(tornado.httpclient.HTTPClientError):
 #         response = yield http_client.fetch(base_url, method="DELETE")
 
+
+
+@pytest.mark.gen_test
+def test_artists_handler_bulk_post(http_client, artists_base_url):
+    test_data = [{"Name": "Bulk Star One"}, {"Name": 42}, {"Name": "Bulk Star One"}]
+
+    body = json.dumps(test_data)
+    response = yield http_client.fetch(artists_base_url, method="POST", body=body)
+    assert response.code == 207
+
+    results = json.loads(response.body)['results']
+    assert [result['status'] for result in results] == [201, 400, 200]
+    assert results[0]['Id'] == results[2]['Id']
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+from pymongo import ReadPreference
+
+from irdb.app.config import client_options, collection_options, load_config, server_options
+from irdb.irdb import make_app
+
+
+def test_load_config_defaults():
+    config = load_config(environ={})
+
+    assert config.database == 'test'
+    assert client_options(config) == {'maxPoolSize': 100, 'minPoolSize': 0}
+
+
+def test_load_config_environment_overrides_file(tmp_path):
+    config_file = tmp_path / 'irdb.json'
+    config_file.write_text(json.dumps({"database": "irdb", "max_pool_size": 50, "compressors": "zstd"}))
+
+    config = load_config(environ={'IRDB_CONFIG': str(config_file), 'IRDB_MAX_POOL_SIZE': '20'})
+
+    assert config.database == 'irdb'
+    assert client_options(config) == {'maxPoolSize': 20, 'minPoolSize': 0, 'compressors': 'zstd'}
+
+
+def test_collection_options_per_operation():
+    config = load_config(environ={
+        'IRDB_READ_PREFERENCE_LIST': 'secondaryPreferred',
+        'IRDB_WRITE_CONCERN_BULK': 'w=1,j=false',
+    })
+
+    options = collection_options(config)
+
+    assert options['list'] == {'read_preference': ReadPreference.SECONDARY_PREFERRED}
+    assert options['bulk']['write_concern'].document == {'w': 1, 'j': False}
+    assert options['single'] == {}
+
+
+@pytest.mark.parametrize('environ', [
+    {'IRDB_MAX_POOL_SIZE': 'many'},
+    {'IRDB_READ_PREFERENCE_DETAIL': 'closest'},
+    {'IRDB_WRITE_CONCERN_SINGLE': 'w=1,durable=true'},
+])
+def test_load_config_rejects_invalid_values(environ):
+    with pytest.raises(ValueError):
+        load_config(environ=environ)
+
+
+def test_server_options():
+    config = load_config(environ={'IRDB_WORKERS': '0', 'IRDB_XHEADERS': 'true', 'IRDB_IDLE_CONNECTION_TIMEOUT': '30'})
+
+    assert config.workers == 0
+    assert server_options(config) == {'xheaders': True, 'idle_connection_timeout': 30.0}
+
+
+def test_page_size_is_capped_by_the_maximum():
+    app = make_app(load_config(environ={'IRDB_PAGE_SIZE': '500', 'IRDB_MAX_PAGE_SIZE': '200'}))
+
+    assert app.settings['page_size'] == 200
+    assert app.settings['max_page_size'] == 200
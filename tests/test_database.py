@@ -0,0 +1,27 @@
+from irdb.app.database import is_id_conflict, make_etag, parse_etags, text_condition
+
+
+def test_is_id_conflict_reads_the_key_pattern():
+    assert is_id_conflict({'code': 11000, 'keyPattern': {'Id': 1}, 'keyValue': {'Id': 7}})
+    assert not is_id_conflict({'code': 11000, 'keyPattern': {'_hash': 1}, 'keyValue': {'_hash': 'abc'}})
+
+
+def test_is_id_conflict_falls_back_to_the_index_name():
+    assert is_id_conflict({'code': 11000, 'errmsg': 'E11000 duplicate key error collection: irdb.songs index: Id_unique'})
+    assert not is_id_conflict({'code': 11000, 'errmsg': 'E11000 duplicate key error index: hash_unique'})
+    assert not is_id_conflict(None)
+
+
+def test_text_condition_matches_substrings_by_default():
+    assert text_condition('metal') == {'$regex': 'metal', '$options': 'i'}
+    assert text_condition('a.b') == {'$regex': 'a\\.b', '$options': 'i'}
+    assert text_condition('metal', 'prefix') == {'$gte': 'metal', '$lt': 'metal\uffff'}
+    assert text_condition('Metal', 'exact') == 'Metal'
+
+
+def test_etags_of_representations_match_their_version():
+    assert make_etag(3) == '"3"'
+    assert make_etag(3, 'msgpack') != make_etag(3, 'json')
+
+    assert parse_etags(f"{make_etag(3, 'json-1a2b3c4d')}, W/{make_etag(4)}, \"other\"") == [3, 4]
+    assert parse_etags('*') is None
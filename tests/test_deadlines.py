@@ -0,0 +1,63 @@
+import asyncio
+from unittest import mock
+
+import pytest
+import tornado
+from tornado import gen
+
+from irdb.app import deadlines
+from irdb.app.deadlines import killable, operation_comment, request_timeout
+from irdb.app.handlers import SongsHandler
+
+
+def test_request_timeout_header_is_capped():
+    assert request_timeout(None, 10.0, 60.0) == 10.0
+    assert request_timeout('2.5', 10.0, 60.0) == 2.5
+    assert request_timeout('600', 10.0, 60.0) == 60.0
+
+    for header in ('0', '-1', 'soon', 'nan'):
+        with pytest.raises(ValueError):
+            request_timeout(header, 10.0, 60.0)
+
+
+@pytest.mark.gen_test
+def test_killable_kills_cancelled_operations(monkeypatch):
+    killed = []
+
+    async def kill_operations(client, comment):
+        killed.append(comment)
+
+    monkeypatch.setattr(deadlines, 'kill_operations', kill_operations)
+    monkeypatch.setattr(deadlines, '_kill_tasks', set())
+
+    comment = operation_comment()
+    operation = asyncio.ensure_future(killable(None, comment, gen.sleep(1)))
+    yield gen.moment
+
+    operation.cancel()
+    yield gen.moment
+    yield gen.moment
+
+    assert operation.cancelled()
+    assert killed == [comment]
+
+    # The kill task is referenced until it is done
+    yield gen.moment
+    assert not deadlines._kill_tasks
+
+
+@pytest.mark.gen_test
+def test_invalid_request_timeout_header(http_client, base_url):
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(base_url, headers={'X-Request-Timeout': 'soon'}, follow_redirects=False)
+
+    assert error.value.code == 400
+
+
+def test_connection_closed_before_prepare(app):
+    request = tornado.httputil.HTTPServerRequest(method='GET', uri='/songs', connection=mock.Mock())
+    handler = SongsHandler(app, request)
+
+    handler.on_connection_close()
+
+    assert handler._client_closed
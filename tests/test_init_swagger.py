@@ -0,0 +1,34 @@
+import pytest
+import json
+
+from irdb.init_swagger import SPEC_HASH_KEY, load_swagger_file, spec_hash
+from irdb.irdb import make_handlers
+
+
+def test_load_swagger_file_reuses_up_to_date_spec(tmp_path):
+    file_location = tmp_path / 'swagger.json'
+    handlers = make_handlers()
+
+    spec = load_swagger_file(handlers, str(file_location))
+    assert spec[SPEC_HASH_KEY] == spec_hash(handlers)
+    assert '/songs' in spec['paths']
+
+    # A spec with the current hash is served as is
+    file_location.write_text(json.dumps({SPEC_HASH_KEY: spec_hash(handlers), 'paths': {}}))
+    assert load_swagger_file(handlers, str(file_location))['paths'] == {}
+
+
+def test_load_swagger_file_regenerates_stale_spec(tmp_path):
+    file_location = tmp_path / 'swagger.json'
+    file_location.write_text(json.dumps({SPEC_HASH_KEY: 'stale', 'paths': {}}))
+
+    spec = load_swagger_file(make_handlers(), str(file_location))
+
+    assert '/songs' in spec['paths']
+    assert json.loads(file_location.read_text())[SPEC_HASH_KEY] == spec[SPEC_HASH_KEY]
+
+
+@pytest.mark.gen_test
+def test_swagger_ui_is_served(http_client, base_url):
+    response = yield http_client.fetch(base_url + '/swagger/spec.html')
+    assert response.code == 200
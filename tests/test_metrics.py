@@ -0,0 +1,54 @@
+import os
+
+import pytest
+import tornado
+
+from irdb.app.metrics import Metrics
+
+
+def test_metrics_render_histograms_cumulative():
+    metrics = Metrics(['SongsHandler'])
+
+    metrics.request_started('SongsHandler', 'GET')
+    metrics.request_finished('SongsHandler', 'GET', 200, 0.003, 512)
+    metrics.request_started('SongsHandler', 'GET')
+    metrics.request_finished('SongsHandler', 'GET', 404, 0.2, 50)
+
+    text = metrics.render()
+
+    assert 'irdb_requests_total{handler="SongsHandler",method="GET",status="2xx"} 1' in text
+    assert 'irdb_requests_total{handler="SongsHandler",method="GET",status="4xx"} 1' in text
+    assert 'irdb_request_duration_seconds_bucket{handler="SongsHandler",method="GET",le="0.005"} 1' in text
+    assert 'irdb_request_duration_seconds_bucket{handler="SongsHandler",method="GET",le="+Inf"} 2' in text
+    assert 'irdb_response_size_bytes_sum{handler="SongsHandler",method="GET"} 562' in text
+    assert 'irdb_requests_in_flight{handler="SongsHandler"} 0' in text
+
+
+def test_metrics_add_up_workers(tmp_path):
+    worker = Metrics(['SongsHandler'], directory=str(tmp_path))
+    worker.request_started('SongsHandler', 'GET')
+    worker.request_finished('SongsHandler', 'GET', 200, 0.01, 10)
+    worker.request_started('SongsHandler', 'GET')
+
+    # Another worker, alive, with the same layout
+    other = tmp_path / f'metrics-{os.getppid()}.db'
+    other.write_bytes(bytes(worker.values))
+
+    # A worker that exited, its gauges are left out
+    (tmp_path / 'metrics-999999999.db').write_bytes(bytes(worker.values))
+
+    text = worker.render()
+
+    assert 'irdb_requests_total{handler="SongsHandler",method="GET",status="2xx"} 3' in text
+    assert 'irdb_requests_in_flight{handler="SongsHandler"} 2' in text
+
+
+@pytest.mark.gen_test
+def test_metrics_handler_counts_requests(http_client, base_url):
+    with pytest.raises(tornado.httpclient.HTTPClientError):
+        yield http_client.fetch(base_url, follow_redirects=False)
+
+    response = yield http_client.fetch(base_url + '/metrics')
+
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'irdb_requests_total{handler="MainHandler",method="GET",status="3xx"} 1' in response.body.decode()
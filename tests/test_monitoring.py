@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+from irdb.app.metrics import Metrics
+from irdb.app.monitoring import (
+    COLLECTIONS, CommandMonitor, RequestTiming, command_shape, plan_summary, request_timing,
+)
+
+
+def command_events(request_id, command_name, command, duration_micros):
+    started = SimpleNamespace(
+        request_id=request_id, command_name=command_name, command=command, database_name='test',
+    )
+    succeeded = SimpleNamespace(request_id=request_id, command_name=command_name, duration_micros=duration_micros)
+
+    return started, succeeded
+
+
+def test_command_shape_redacts_values():
+    command = {
+        'find': 'songs',
+        'filter': {'Year': {'$gte': 1990}, 'Id': {'$in': [1, 2, 3]}, 'Name': 'Thunderstruck'},
+        'sort': {'Year': 1},
+        'lsid': {'id': 'session'},
+    }
+
+    assert command_shape('find', command) == {
+        'filter': {'Year': {'$gte': '?'}, 'Id': {'$in': ['?']}, 'Name': '?'},
+        'sort': {'Year': '?'},
+    }
+
+
+def test_command_monitor_records_timing_and_slow_commands():
+    metrics = Metrics([], collections=COLLECTIONS)
+    monitor = CommandMonitor(metrics, slow_query_ms=100)
+    timing = RequestTiming()
+    request_timing.set(timing)
+
+    fast = command_events(1, 'find', {'find': 'songs', 'filter': {'Id': 5}}, 2000)
+    slow = command_events(2, 'distinct', {'distinct': 'artists', 'key': 'Name', 'query': {}}, 250000)
+
+    for started, succeeded in (fast, slow):
+        monitor.started(started)
+        monitor.succeeded(succeeded)
+
+    request_timing.set(None)
+
+    assert timing.server_timing() == 'db;dur=252.00;desc="2 commands", db-songs;dur=2.00, db-artists;dur=250.00'
+    assert [(entry['command'], entry['collection'], entry['count']) for entry in monitor.stats()] == [
+        ('distinct', 'artists', 1),
+    ]
+    assert 'irdb_mongo_command_duration_seconds_count{collection="songs",command="find"} 1' in metrics.render()
+
+
+def test_plan_summary_of_aggregation():
+    explain_result = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {
+        'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'Year_1'},
+    }}}}]}
+
+    assert plan_summary(explain_result) == 'FETCH > IXSCAN Year_1'
@@ -0,0 +1,56 @@
+import pstats
+
+import pytest
+import tornado
+from tornado import gen
+
+from irdb.app.profiling import Profiler, collapsed_stacks, pstats_dump
+
+
+def sort_songs(songs):
+    return sorted(songs, key=lambda song: -song)
+
+
+@pytest.mark.gen_test
+def test_profiler_profiles_only_the_wrapped_coroutine(tmp_path):
+    profiler = Profiler(max_profiles=1)
+
+    async def handler_method():
+        await gen.sleep(0.01)
+        return sort_songs(range(1000))
+
+    async def other_request():
+        await gen.sleep(0.005)
+        return sorted(range(1000))
+
+    request_profile = profiler.start()
+    yield [profiler.wrap(handler_method, request_profile)(), other_request()]
+    profiler.add(request_profile, 'SongsHandler', 'GET', '/songs', 200, 0.02)
+
+    record = profiler.get(request_profile.id)
+    stack = [line for line in collapsed_stacks(record).splitlines() if 'sort_songs' in line]
+
+    assert stack and 'handler_method' in stack[0]
+    assert not any('other_request' in line for line in collapsed_stacks(record).splitlines())
+
+    path = tmp_path / 'profile.pstats'
+    path.write_bytes(pstats_dump(record))
+    assert any(name == 'sort_songs' for filename, line, name in pstats.Stats(str(path)).stats)
+
+
+def test_profiler_keeps_the_newest_profiles():
+    profiler = Profiler(max_profiles=2)
+
+    for _ in range(3):
+        profiler.add(profiler.start(), 'SongsHandler', 'GET', '/songs', 200, 0.01)
+
+    assert [summary['id'] for summary in profiler.summaries()] == [3, 2]
+    assert 'stats' not in profiler.summaries()[0]
+
+
+@pytest.mark.gen_test
+def test_profiles_handler_requires_admin_token(http_client, base_url):
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(base_url + '/admin/profiles', headers={'X-Admin-Token': ''})
+
+    assert error.value.code == 403
@@ -0,0 +1,90 @@
+import pytest
+
+from irdb.app.cache import CachedResponse, ResponseCache
+from irdb.app.config import load_config
+from irdb.irdb import make_app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_response(body):
+    return CachedResponse(body, '"etag"', {})
+
+
+def test_response_cache_hits_and_misses(clock):
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+
+    assert cache.get('songs') is None
+    cache.set('songs', ('songs',), make_response(b'[]'))
+
+    assert cache.get('songs').body == b'[]'
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_response_cache_evicts_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+    cache.set('a', ('songs',), make_response(b'a'))
+    cache.set('b', ('songs',), make_response(b'b'))
+
+    cache.get('a')
+    cache.set('c', ('songs',), make_response(b'c'))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_response_cache_expires_entries(clock):
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+    cache.set('a', ('songs',), make_response(b'a'))
+
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_response_cache_invalidates_by_tag(clock):
+    cache = ResponseCache(max_entries=10, ttl=10, clock=clock)
+    cache.set('list', ('songs',), make_response(b'[]'))
+    cache.set('detail', ('songs:190',), make_response(b'{}'))
+
+    cache.invalidate('songs')
+
+    assert cache.get('list') is None
+    assert cache.get('detail') is not None
+
+
+def test_response_cache_skips_responses_read_before_a_write(clock):
+    cache = ResponseCache(max_entries=2, ttl=10, clock=clock)
+
+    generation = cache.generation(('songs:5',))
+    cache.invalidate('songs:5')
+    cache.set('song', ('songs:5',), make_response(b'old'), generation=generation)
+
+    assert cache.get('song') is None
+    assert cache.stats()['stale'] == 1
+
+    cache.set('song', ('songs:5',), make_response(b'new'), generation=cache.generation(('songs:5',)))
+    assert cache.get('song').body == b'new'
+
+
+def test_response_cache_is_configured():
+    config = load_config(environ={'IRDB_RESPONSE_CACHE_SIZE': '10', 'IRDB_RESPONSE_CACHE_TTL': '2.5'})
+    cache = make_app(config).settings['response_cache']
+
+    assert cache.max_entries == 10
+    assert cache.ttl == 2.5
+
+    assert make_app(load_config(environ={'IRDB_RESPONSE_CACHE_SIZE': '0'})).settings['response_cache'] is None
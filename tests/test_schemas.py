@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from irdb.app.schemas import VALIDATORS, ArtistSchema
+
+
+@pytest.mark.parametrize('data', [
+    {"Name": "Def Leppard"},
+    {"Name": ""},
+    {"Name": "A Name Longer Than Sixteen"},
+    {"Name": 42},
+    {"Name": b"Def Leppard"},
+    {"Name": None},
+    {"Id": True},
+    {"Id": "760"},
+    {"Named": "Rock Stars"},
+    ["Def Leppard"],
+])
+def test_artist_validator_agrees_with_marshmallow(data):
+    assert VALIDATORS['artists'].validate(data) == ArtistSchema().validate(data)
+
+
+def test_validator_parses_and_validates_in_one_step():
+    body = json.dumps([{"Name": "Def Leppard"}, {"Name": 42}]).encode()
+
+    data, errors = VALIDATORS['artists'].parse(body, json.loads, many=True)
+
+    assert len(data) == 2
+    assert list(errors) == [1]
+
+
+def test_validator_rejects_list_unless_many():
+    data, errors = VALIDATORS['songs'].parse(b'[{"Name": "Kryptonite"}]', json.loads)
+
+    assert errors == {'_schema': ['Invalid input type.']}
+
+
+def test_validator_skips_lists_over_the_limit():
+    body = json.dumps([{"Name": 42}] * 3).encode()
+
+    data, errors = VALIDATORS['artists'].parse(body, json.loads, many=True, max_items=2)
+
+    assert len(data) == 3
+    assert errors == {}
@@ -0,0 +1,16 @@
+import pytest
+import tornado
+
+
+@pytest.fixture
+def search_base_url(base_url):
+    return base_url + '/search'
+
+
+@pytest.mark.gen_test
+def test_search_handler_rejects_limit_below_one(http_client, search_base_url):
+    for limit in ('0', '-1'):
+        with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+            yield http_client.fetch(search_base_url + '?q=queen&limit=' + limit)
+
+        assert error.value.code == 400
@@ -0,0 +1,111 @@
+import pytest
+
+from irdb.app.search import SEARCH_FIELDS, SearchIndex, refresh_search_indexes, tokenize
+
+
+@pytest.fixture
+def song_index():
+    index = SearchIndex(SEARCH_FIELDS['songs'])
+    index.add({"Id": 1, "Name": "Enter Sandman", "Artist": "Metallica", "Album": "Metallica", "Genre": "Metal"})
+    index.add({"Id": 2, "Name": "The Trooper", "Artist": "Iron Maiden", "Album": "Piece of Mind", "Genre": "Metal"})
+    index.add({"Id": 3, "Name": "(Don't Fear) The Reaper", "Artist": "Blue Öyster Cult",
+               "Album": "Agents of Fortune", "Genre": "Classic Rock"})
+    return index
+
+
+def test_tokenize_strips_case_and_accents():
+    assert tokenize("Blue Öyster Cult") == ['blue', 'oyster', 'cult']
+
+
+def test_search_ranks_exact_matches(song_index):
+    hits = song_index.search("metallica")
+
+    assert [document['Id'] for score, document in hits] == [1]
+
+
+def test_search_tolerates_typos(song_index):
+    hits = song_index.search("metalica")
+
+    assert hits[0][1]['Id'] == 1
+
+
+def test_search_prefix_mode(song_index):
+    hits = song_index.search("the tr", prefix=True)
+
+    assert hits[0][1]['Id'] == 2
+
+
+def test_search_index_follows_updates_and_deletes(song_index):
+    song_index.add({"Id": 2, "Name": "Aces High", "Artist": "Iron Maiden"})
+    assert song_index.search("trooper") == []
+    assert song_index.search("aces")[0][1]['Id'] == 2
+
+    song_index.remove(2)
+    assert song_index.search("maiden") == []
+    assert len(song_index) == 2
+
+
+class FakeCursor:
+    def __init__(self, documents, on_document=None):
+        self.documents = documents
+        self.on_document = on_document
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+            if self.on_document is not None:
+                self.on_document(document)
+
+
+class FakeCollection:
+    def __init__(self, documents, on_document=None):
+        self.documents = documents
+        self.on_document = on_document
+
+    def find(self, query_filter, projection):
+        return FakeCursor(self.documents, self.on_document)
+
+
+@pytest.mark.gen_test
+def test_refresh_search_indexes_picks_up_other_writes(song_index):
+    indexes = {'songs': song_index}
+    db = {'songs': FakeCollection([{"Id": 4, "Name": "Paranoid", "Artist": "Black Sabbath"}])}
+
+    yield refresh_search_indexes(indexes, db)
+
+    assert indexes['songs'] is not song_index
+    assert [document['Id'] for score, document in indexes['songs'].search("paranoid")] == [4]
+    assert indexes['songs'].search("sandman") == []
+
+
+@pytest.mark.gen_test
+def test_refresh_search_indexes_keeps_writes_made_during_the_rebuild(song_index):
+    indexes = {'songs': song_index}
+    documents = [{"Id": 1, "Name": "Enter Sandman"}, {"Id": 4, "Name": "Paranoid"}]
+
+    def write(document):
+        # The rebuild already read Id 1 when these writes are made
+        if document['Id'] == 1:
+            indexes['songs'].apply_write({"Id": 1, "Name": "Master of Puppets"})
+            indexes['songs'].apply_write(doc_id=4)
+
+    yield refresh_search_indexes(indexes, {'songs': FakeCollection(documents, write)})
+
+    assert indexes['songs'] is not song_index
+    assert indexes['songs'].search("sandman") == []
+    assert indexes['songs'].search("puppets")[0][1]['Id'] == 1
+    assert indexes['songs'].search("paranoid") == []
+
+
+def test_search_index_ignores_writes_until_loaded():
+    index = SearchIndex(SEARCH_FIELDS['artists'])
+
+    index.apply_write({"Id": 1, "Name": "Metallica"})
+
+    assert len(index) == 0
@@ -0,0 +1,31 @@
+import pytest
+
+from irdb.app.serializers import JSON_SERIALIZERS, MSGPACK_SERIALIZER, get_json_serializer, make_serializers, negotiate
+
+
+@pytest.fixture
+def serializers():
+    return make_serializers(JSON_SERIALIZERS['json'])
+
+
+def test_negotiate_defaults_to_json(serializers):
+    assert negotiate(None, serializers).content_type == 'application/json'
+    assert negotiate('text/html, */*;q=0.8', serializers).content_type == 'application/json'
+
+
+@pytest.mark.skipif(MSGPACK_SERIALIZER is None, reason='msgpack is not installed')
+def test_negotiate_follows_quality(serializers):
+    assert negotiate('application/json;q=0.5, application/msgpack', serializers) is MSGPACK_SERIALIZER
+    assert negotiate('application/msgpack;q=0, application/json', serializers).content_type == 'application/json'
+
+
+@pytest.mark.skipif(MSGPACK_SERIALIZER is None, reason='msgpack is not installed')
+def test_msgpack_round_trip():
+    song = {'Id': 190, 'Name': "(Don't Fear) The Reaper", 'Bpm': None}
+
+    assert MSGPACK_SERIALIZER.loads(MSGPACK_SERIALIZER.dumps(song)) == song
+
+
+def test_get_json_serializer_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        get_json_serializer('yaml')
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from tornado import gen
+
+from irdb.app.coalesce import SingleFlight, query_key
+
+
+def test_query_key_ignores_filter_order():
+    assert query_key('songs', {'Name': 'a', 'Genre': 'b'}) == query_key('songs', {'Genre': 'b', 'Name': 'a'})
+
+
+@pytest.mark.gen_test
+def test_single_flight_coalesces_identical_calls():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def query():
+        calls.append(1)
+        await gen.sleep(0.01)
+        return ['song']
+
+    results = yield [single_flight.run('songs', query) for _ in range(5)]
+
+    assert results == [['song']] * 5
+    assert len(calls) == 1
+    assert single_flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+@pytest.mark.gen_test
+def test_single_flight_shares_errors():
+    single_flight = SingleFlight()
+
+    async def query():
+        await gen.sleep(0.01)
+        raise ValueError('query failed')
+
+    with pytest.raises(ValueError):
+        yield [single_flight.run('songs', query) for _ in range(2)]
+
+    assert len(single_flight) == 0
+
+
+@pytest.mark.gen_test
+def test_single_flight_call_survives_a_cancelled_caller():
+    single_flight = SingleFlight()
+
+    async def query():
+        await gen.sleep(0.01)
+        return ['song']
+
+    leader = asyncio.ensure_future(single_flight.run('songs', query))
+    follower = asyncio.ensure_future(single_flight.run('songs', query))
+    yield gen.moment
+
+    leader.cancel()
+
+    assert (yield follower) == ['song']
+    assert leader.cancelled()
+
+
+@pytest.mark.gen_test
+def test_single_flight_cancels_call_without_callers():
+    single_flight = SingleFlight()
+    cancelled = []
+
+    async def query():
+        try:
+            await gen.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    caller = asyncio.ensure_future(single_flight.run('songs', query))
+    yield gen.moment
+
+    caller.cancel()
+    yield gen.sleep(0.01)
+
+    assert cancelled == [True]
+    assert len(single_flight) == 0
+
+
+@pytest.mark.gen_test
+def test_single_flight_joins_only_calls_covering_the_deadline():
+    single_flight = SingleFlight()
+    deadlines = []
+
+    def query(deadline):
+        async def run():
+            deadlines.append(deadline)
+            await gen.sleep(0.01)
+            return deadline
+
+        return run
+
+    # The short deadline of the first caller would fail the later ones
+    results = yield [single_flight.run('songs', query(deadline), deadline=deadline) for deadline in (0.1, 10, 5)]
+
+    assert results == [0.1, 10, 10]
+    assert deadlines == [0.1, 10]
+    assert single_flight.stats() == {'calls': 2, 'coalesced': 1, 'in_flight': 0}
+
+
+@pytest.mark.gen_test
+def test_single_flight_invalidated_group_starts_a_new_call():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def query():
+        calls.append(1)
+        number = len(calls)
+        await gen.sleep(0.01)
+        return number
+
+    before = asyncio.ensure_future(single_flight.run('songs', query, group='songs'))
+    yield gen.moment
+
+    # A write finished while the first call was in flight
+    single_flight.invalidate('songs')
+    after = yield single_flight.run('songs', query, group='songs')
+
+    assert (yield before) == 1
+    assert after == 2
+    assert len(single_flight) == 0
@@ -56,3 +56,121 @@ def test_songs_handler_create_new_post(http_client, songs_base_url):
 
     assert response.code == 201
     assert response.body == b'{}'
+
+
+@pytest.mark.gen_test
+def test_songs_handler_concurrent_posts_get_unique_ids(http_client, songs_base_url):
+    first_song = {"Name": "Thunderstruck", "Artist": "AC/DC", "Year": 1990}
+    second_song = {"Name": "Highway to Hell", "Artist": "AC/DC", "Year": 1979}
+
+    responses = yield [
+        http_client.fetch(songs_base_url, method="POST", body=json.dumps(first_song)),
+        http_client.fetch(songs_base_url, method="POST", body=json.dumps(second_song)),
+    ]
+
+    ids = [json.loads(response.body)['Id'] for response in responses]
+    assert ids[0] != ids[1]
+
+
+@pytest.mark.gen_test
+def test_songs_handler_rejects_too_many_items(http_client, songs_base_url):
+    body = json.dumps([{"Name": "Kryptonite"}] * 1001)
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(songs_base_url, method="POST", body=body)
+
+    assert error.value.code == 413
+
+
+@pytest.mark.gen_test
+def test_songs_handler_get_paginates(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '?limit=2')
+    assert response.code == 200
+
+    first_page = json.loads(response.body)
+    assert len(first_page) == 2
+    assert response.headers['X-Next-Cursor'] == str(first_page[-1]['Id'])
+
+    response = yield http_client.fetch(songs_base_url + '?limit=2&after=' + response.headers['X-Next-Cursor'])
+    second_page = json.loads(response.body)
+    assert second_page[0]['Id'] > first_page[-1]['Id']
+
+
+@pytest.mark.gen_test
+def test_songs_handler_get_exports_ndjson(http_client, songs_base_url):
+    headers = {'Accept': 'application/x-ndjson'}
+    response = yield http_client.fetch(songs_base_url + '?genre=metal', headers=headers)
+    assert response.code == 200
+    assert response.headers['Content-Type'] == 'application/x-ndjson'
+
+    songs = [json.loads(line) for line in response.body.splitlines()]
+    assert all('metal' in song['Genre'].lower() for song in songs)
+
+
+@pytest.mark.gen_test
+def test_songs_handler_get_year_range_sorted(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '?year_min=1980&year_max=1989&sort=-year')
+    assert response.code == 200
+
+    years = [song['Year'] for song in json.loads(response.body)]
+    assert all(1980 <= year <= 1989 for year in years)
+    assert years == sorted(years, reverse=True)
+
+
+@pytest.mark.gen_test
+def test_song_facets_handler_get(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '/facets?year_min=1980&year_max=1989')
+    assert response.code == 200
+
+    facets = json.loads(response.body)
+    assert [decade['Decade'] for decade in facets['decades']] == [1980]
+    assert sum(genre['count'] for genre in facets['genres']) == facets['total']
+
+
+@pytest.mark.gen_test
+def test_song_handler_put_with_stale_etag_fails(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '/190')
+    etag = response.headers['ETag']
+
+    body = json.dumps({"Bpm": 142})
+    response = yield http_client.fetch(songs_base_url + '/190', method="PUT", body=body, headers={'If-Match': etag})
+    assert response.code == 200
+    assert response.headers['ETag'] != etag
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(songs_base_url + '/190', method="PUT", body=body, headers={'If-Match': etag})
+
+    assert error.value.code == 412
+
+
+@pytest.mark.gen_test
+def test_song_handler_put_can_not_change_the_id(http_client, songs_base_url):
+    body = json.dumps({"Id": 191, "Bpm": 142})
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(songs_base_url + '/190', method="PUT", body=body)
+
+    assert error.value.code == 400
+
+
+@pytest.mark.gen_test
+def test_songs_handler_get_by_ids(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '?ids=190,999999,1')
+    assert response.code == 200
+
+    songs = json.loads(response.body)
+    assert [song and song['Id'] for song in songs] == [190, None, 1]
+
+
+@pytest.mark.gen_test
+def test_songs_handler_get_sparse_fields(http_client, songs_base_url):
+    response = yield http_client.fetch(songs_base_url + '?fields=Name,Artist&limit=5')
+    assert response.code == 200
+
+    songs = json.loads(response.body)
+    assert all(set(song) == {'Id', 'Name', 'Artist'} for song in songs)
+
+    with pytest.raises(tornado.httpclient.HTTPClientError) as error:
+        yield http_client.fetch(songs_base_url + '?fields=Lyrics')
+
+    assert error.value.code == 400
@@ -0,0 +1,66 @@
+import pytest
+
+from irdb.app.batching import WriteBatcher
+from irdb.app.config import load_config
+from irdb.app.metrics import Metrics
+from irdb.irdb import make_app
+
+
+@pytest.mark.gen_test
+def test_write_batcher_combines_concurrent_inserts():
+    writes = []
+
+    async def write(collection, documents):
+        writes.append((collection, len(documents)))
+        return [document['Name'].upper() for document in documents]
+
+    write_batcher = WriteBatcher(write, max_batch_size=3, max_delay=0.01)
+
+    results = yield [write_batcher.insert('songs', {'Name': name}) for name in 'abcde']
+
+    assert results == ['A', 'B', 'C', 'D', 'E']
+    assert writes == [('songs', 3), ('songs', 2)]
+
+    stats = write_batcher.stats()
+    assert stats['batches'] == 2
+    assert stats['largest_batch'] == 3
+    assert stats['queued'] == 0
+
+
+@pytest.mark.gen_test
+def test_write_batcher_fails_the_whole_batch():
+    async def write(collection, documents):
+        raise ValueError('insert failed')
+
+    write_batcher = WriteBatcher(write, max_batch_size=10, max_delay=0.001)
+
+    with pytest.raises(ValueError):
+        yield [write_batcher.insert('songs', {'Name': name}) for name in 'ab']
+
+
+def test_write_batching_is_configured():
+    assert make_app(load_config(environ={})).settings['write_batcher'] is None
+
+    config = load_config(environ={'IRDB_WRITE_BATCH_SIZE': '10', 'IRDB_WRITE_BATCH_DELAY': '0.005'})
+    write_batcher = make_app(config).settings['write_batcher']
+
+    assert write_batcher.max_batch_size == 10
+    assert write_batcher.max_delay == 0.005
+
+
+@pytest.mark.gen_test
+def test_write_batcher_exports_metrics():
+    metrics = Metrics([], collections=('songs',))
+
+    async def write(collection, documents):
+        return [None] * len(documents)
+
+    write_batcher = WriteBatcher(write, max_batch_size=2, max_delay=0.01, metrics=metrics)
+
+    yield [write_batcher.insert('songs', {'Name': name}) for name in 'abc']
+
+    text = metrics.render()
+    assert 'irdb_write_batches_total{collection="songs",trigger="full"} 1' in text
+    assert 'irdb_write_batches_total{collection="songs",trigger="delay"} 1' in text
+    assert 'irdb_write_batch_size_sum{collection="songs"} 3' in text
+    assert 'irdb_write_batch_queue_wait_seconds_count{collection="songs"} 3' in text